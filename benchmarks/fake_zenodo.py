@@ -0,0 +1,267 @@
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+
+
+class FakeZenodo:
+    """
+    In-process stand-in for the parts of the Zenodo REST API cogs_archive
+    uses: depositions (create, metadata, new version, file delete, publish),
+    bucket uploads, published records and file downloads with Range support.
+
+    `latency_s` is added before every response, `bytes_per_s` caps each
+    connection's transfer rate in both directions, and `failure_rate` is the
+    fraction of requests answered with a 503 (drawn from a seeded RNG, so runs
+    are repeatable).
+    """
+
+    def __init__(
+        self,
+        latency_s: float = 0.0,
+        bytes_per_s: int | None = None,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency_s = latency_s
+        self.bytes_per_s = bytes_per_s
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1000)
+        self.depositions: dict[int, dict] = {}
+        # deposition id -> {filename: body}
+        self.bodies: dict[int, dict[str, bytes]] = {}
+        self.requests = 0
+        self.failures = 0
+        self._httpd: ThreadingHTTPServer | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}/api"
+
+    def start(self) -> "FakeZenodo":
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _handler_for(self))
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FakeZenodo":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def add_published(self, files: dict[str, bytes]) -> dict:
+        """Register a published record holding `files`; returns its JSON."""
+        dep = self._new_deposition()
+        self.bodies[dep["id"]] = dict(files)
+        return self._publish(dep["id"])
+
+    def download_url(self, dep_id: int, name: str) -> str:
+        return f"{self.base_url}/files/{dep_id}/{name}"
+
+    def _new_deposition(self, files: dict[str, bytes] | None = None) -> dict:
+        with self._lock:
+            dep_id = next(self._ids)
+        dep = {
+            "id": dep_id,
+            "conceptrecid": dep_id,
+            "submitted": False,
+            "links": {"bucket": f"{self.base_url}/bucket/{dep_id}"},
+            "metadata": {},
+        }
+        self.depositions[dep_id] = dep
+        self.bodies[dep_id] = dict(files or {})
+        return dep
+
+    def _files_json(self, dep_id: int) -> list[dict]:
+        return [
+            {
+                "id": f"{dep_id}-{name}",
+                "filename": name,
+                "key": name,
+                "filesize": len(body),
+                "size": len(body),
+                "checksum": "md5:" + hashlib.md5(body).hexdigest(),
+                "links": {"download": self.download_url(dep_id, name)},
+            }
+            for name, body in self.bodies[dep_id].items()
+        ]
+
+    def _deposition_json(self, dep_id: int) -> dict:
+        return {**self.depositions[dep_id], "files": self._files_json(dep_id)}
+
+    def _publish(self, dep_id: int) -> dict:
+        dep = self.depositions[dep_id]
+        dep.update(
+            submitted=True,
+            record_id=dep_id,
+            doi=f"10.5281/zenodo.{dep_id}",
+            conceptdoi=f"10.5281/zenodo.{dep['conceptrecid']}",
+            created="2026-01-01T00:00:00Z",
+        )
+        return self._deposition_json(dep_id)
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            fail = self.failure_rate and self._rng.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+            return bool(fail)
+
+
+def _handler_for(fake: FakeZenodo) -> type[BaseHTTPRequestHandler]:
+    routes = []
+
+    def route(method: str, pattern: str):
+        def register(fn):
+            routes.append((method, re.compile(f"^/api{pattern}$"), fn))
+            return fn
+
+        return register
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _dispatch(self, method: str) -> None:
+            path = urlsplit(self.path).path
+            body = self._read_body()
+            if fake.latency_s:
+                time.sleep(fake.latency_s)
+            if fake._should_fail():
+                return self._json(503, {"message": "injected failure"})
+            for m, rx, fn in routes:
+                match = rx.match(path)
+                if m == method and match:
+                    return fn(self, body, *match.groups())
+            self._json(404, {"message": f"no route for {method} {path}"})
+
+        def _read_body(self) -> bytes:
+            length = int(self.headers.get("Content-Length") or 0)
+            chunks = []
+            while length:
+                chunk = self.rfile.read(min(length, 64 * 1024))
+                if not chunk:
+                    break
+                self._throttle(len(chunk))
+                chunks.append(chunk)
+                length -= len(chunk)
+            return b"".join(chunks)
+
+        def _throttle(self, nbytes: int) -> None:
+            if fake.bytes_per_s:
+                time.sleep(nbytes / fake.bytes_per_s)
+
+        def _send(self, status: int, body: bytes, headers: dict | None = None):
+            self.send_response(status)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            for i in range(0, len(body), 64 * 1024):
+                chunk = body[i : i + 64 * 1024]
+                self._throttle(len(chunk))
+                self.wfile.write(chunk)
+
+        def _json(self, status: int, payload, headers: dict | None = None):
+            self._send(
+                status,
+                json.dumps(payload).encode(),
+                {"Content-Type": "application/json", **(headers or {})},
+            )
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_PUT(self):
+            self._dispatch("PUT")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+    @route("POST", "/deposit/depositions")
+    def create(h, body):
+        h._json(201, fake._deposition_json(fake._new_deposition()["id"]))
+
+    @route("GET", r"/deposit/depositions/(\d+)")
+    def get_deposition(h, body, dep_id):
+        h._json(200, fake._deposition_json(int(dep_id)))
+
+    @route("PUT", r"/deposit/depositions/(\d+)")
+    def update_metadata(h, body, dep_id):
+        fake.depositions[int(dep_id)]["metadata"] = json.loads(body)["metadata"]
+        h._json(200, fake._deposition_json(int(dep_id)))
+
+    @route("POST", r"/deposit/depositions/(\d+)/actions/publish")
+    def publish(h, body, dep_id):
+        h._json(202, fake._publish(int(dep_id)))
+
+    @route("POST", r"/deposit/depositions/(\d+)/actions/newversion")
+    def new_version(h, body, dep_id):
+        prev = fake.depositions[int(dep_id)]
+        draft = fake._new_deposition(fake.bodies[int(dep_id)])
+        draft["conceptrecid"] = prev["conceptrecid"]
+        url = f"{fake.base_url}/deposit/depositions/{draft['id']}"
+        prev_json = fake._deposition_json(int(dep_id))
+        h._json(201, {**prev_json, "links": {"latest_draft": url}})
+
+    @route("DELETE", r"/deposit/depositions/(\d+)/files/([^/]+)")
+    def delete_file(h, body, dep_id, file_id):
+        name = file_id.split("-", 1)[1]
+        fake.bodies[int(dep_id)].pop(name, None)
+        h._send(204, b"")
+
+    @route("PUT", r"/bucket/(\d+)/([^/]+)")
+    def upload(h, body, dep_id, name):
+        fake.bodies[int(dep_id)][name] = body
+        h._json(
+            201,
+            {
+                "key": name,
+                "size": len(body),
+                "checksum": "md5:" + hashlib.md5(body).hexdigest(),
+            },
+        )
+
+    @route("GET", r"/records/(\d+)")
+    def record(h, body, recid):
+        payload = fake._deposition_json(int(recid))
+        etag = '"' + hashlib.md5(json.dumps(payload).encode()).hexdigest() + '"'
+        if h.headers.get("If-None-Match") == etag:
+            return h._send(304, b"", {"ETag": etag})
+        h._json(200, payload, {"ETag": etag})
+
+    @route("GET", r"/files/(\d+)/([^/]+)")
+    def download(h, body, dep_id, name):
+        data = fake.bodies[int(dep_id)][name]
+        rng = h.headers.get("Range")
+        if rng:
+            start = int(rng[len("bytes=") : -1])
+            if start >= len(data):
+                return h._send(416, b"", {"Content-Range": f"bytes */{len(data)}"})
+            return h._send(
+                206,
+                data[start:],
+                {"Content-Range": f"bytes {start}-{len(data) - 1}/{len(data)}"},
+            )
+        h._send(200, data)
+
+    return Handler
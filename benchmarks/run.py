@@ -0,0 +1,432 @@
+"""
+Benchmarks for the fetch, publish and registry hot paths, run against a local
+FakeZenodo server, and for package import time.
+
+    python benchmarks/run.py                    # run and compare to baseline
+    python benchmarks/run.py --only registry    # cases whose name matches
+    python benchmarks/run.py --update-baseline  # record this machine's numbers
+
+The baseline, benchmarks/baseline.json, is recorded locally and not committed:
+timings from another machine say nothing about this one. Exits non-zero if
+any case's median time regresses past --tolerance relative to a baseline
+recorded on this machine with the same server settings by more than
+--min-delta-ms, or if every operation of a case fails. Without such a
+baseline the timings are only reported.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+# run from a checkout, without installing the package first
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cogs_archive import registry as registry_module
+from cogs_archive.cache import Cache
+from cogs_archive.dataset import RegisteredDataset
+from cogs_archive.publish import publish
+from cogs_archive.registry import DatasetRegistry
+
+from fake_zenodo import FakeZenodo
+
+BASELINE = Path(__file__).with_name("baseline.json")
+MiB = 1024 * 1024
+
+
+@dataclass
+class Result:
+    name: str
+    # seconds per operation
+    times: list[float]
+    # work per operation, in `unit`s (bytes are reported as MB)
+    work: float
+    unit: str
+    # operations that raised (e.g. under --failure-rate); not in `times`
+    errors: int = 0
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.times)
+
+    @property
+    def p95(self) -> float:
+        ordered = sorted(self.times)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    @property
+    def throughput(self) -> float:
+        return self.work / self.median if self.median else float("inf")
+
+
+Case = Callable[[FakeZenodo, Path], Result]
+CASES: dict[str, Case] = {}
+
+
+def case(name: str):
+    def register(fn: Case) -> Case:
+        CASES[name] = fn
+        return fn
+
+    return register
+
+
+_errors: list[Exception] = []
+
+
+def _timed(op: Callable[[], object], repeat: int, setup=None) -> list[float]:
+    # failed operations are collected in _errors rather than timed
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        try:
+            op()
+        except Exception as exc:
+            _errors.append(exc)
+            continue
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def _dataset(fake: FakeZenodo, n_files: int, size: int) -> RegisteredDataset:
+    rng = random.Random(n_files * size)
+    files = {f"part{i}.csv": rng.randbytes(size) for i in range(n_files)}
+    rec = fake.add_published(files)
+    spec = {
+        "zenodo": {
+            "versions": [
+                {
+                    "version": "1.0.0",
+                    "recid": rec["id"],
+                    "files": [
+                        {
+                            "name": f["filename"],
+                            "checksum": f["checksum"],
+                            "size": f["filesize"],
+                            "download_url": f["links"]["download"],
+                        }
+                        for f in rec["files"]
+                    ],
+                }
+            ]
+        }
+    }
+    return RegisteredDataset(dataset_id=f"bench_{rec['id']}", spec=spec)
+
+
+def _fetch_case(warm: bool, n_files: int, size: int, repeat: int) -> Case:
+    def run(fake: FakeZenodo, tmp: Path) -> Result:
+        ds = _dataset(fake, n_files, size)
+        dirs = iter(range(10_000))
+        cache = Cache(tmp / "cache-warm")
+        if warm:
+            ds.fetch(cache=cache)
+
+        def setup():
+            nonlocal cache
+            if not warm:
+                cache = Cache(tmp / f"cache-{next(dirs)}")
+
+        times = _timed(lambda: ds.fetch(cache=cache), repeat, setup)
+        return Result("", times, n_files * size / 1e6, "MB")
+
+    return run
+
+
+case("fetch_cold_16x2MiB")(_fetch_case(False, 16, 2 * MiB, 5))
+case("fetch_warm_16x2MiB")(_fetch_case(True, 16, 2 * MiB, 10))
+
+
+def _publish_case(n_files: int, size: int, repeat: int) -> Case:
+    def run(fake: FakeZenodo, tmp: Path) -> Result:
+        rng = random.Random(n_files)
+        files = []
+        for i in range(n_files):
+            fp = tmp / f"upload{i}.bin"
+            fp.write_bytes(rng.randbytes(size))
+            files.append(fp)
+        runs = iter(range(10_000))
+
+        def op():
+            # a new dataset each time, so every run uploads every file
+            publish(
+                dataset_id=f"bench_{next(runs)}",
+                files=files,
+                metadata={"title": "Benchmark dataset"},
+                version="1.0.0",
+                registry_path=tmp / "data-registry.yaml",
+            )
+
+        times = _timed(op, repeat)
+        return Result("", times, n_files * size / 1e6, "MB")
+
+    return run
+
+
+case("publish_many_64x64KiB")(_publish_case(64, 64 * 1024, 5))
+case("publish_large_2x32MiB")(_publish_case(2, 32 * MiB, 3))
+
+
+def _write_registry(path: Path, n: int) -> list[str]:
+    ids = [f"dataset_{i:05d}" for i in range(n)]
+    data = {
+        "datasets": {
+            ds: {
+                "title": f"Dataset {ds}",
+                "zenodo": {
+                    "conceptdoi": f"10.5281/zenodo.{i}",
+                    "versions": [
+                        {
+                            "version": "1.0.0",
+                            "recid": 100_000 + i,
+                            "doi": f"10.5281/zenodo.{100_000 + i}",
+                            "files": [
+                                {
+                                    "name": f"part{j}.csv",
+                                    "checksum": f"md5:{i:08d}{j:024d}",
+                                    "size": 1024,
+                                    "download_url": f"https://zenodo.org/{i}/{j}",
+                                }
+                                for j in range(3)
+                            ],
+                        }
+                    ],
+                },
+            }
+            for i, ds in enumerate(ids)
+        }
+    }
+    path.write_text(yaml.safe_dump(data, sort_keys=False))
+    return ids
+
+
+def _registry_cases(n: int) -> None:
+    ops = 1000
+
+    @case(f"registry_load_{n}")
+    def load(fake: FakeZenodo, tmp: Path) -> Result:
+        path = tmp / "data-registry.yaml"
+        _write_registry(path, n)
+        reg = DatasetRegistry(path)
+        times = _timed(reg.list_ids, 5, setup=registry_module._snapshots.clear)
+        return Result("", times, 1, "loads")
+
+    @case(f"registry_get_{n}")
+    def get(fake: FakeZenodo, tmp: Path) -> Result:
+        path = tmp / "data-registry.yaml"
+        ids = _write_registry(path, n)
+        reg = DatasetRegistry(path)
+        picks = random.Random(n).choices(ids, k=ops)
+
+        def op():
+            for ds in picks:
+                reg.get(ds)
+
+        return Result("", _timed(op, 5), ops, "gets")
+
+    for journal in (False, True):
+
+        @case(f"registry_upsert{'_journal' if journal else ''}_{n}")
+        def upsert(fake: FakeZenodo, tmp: Path, journal=journal) -> Result:
+            path = tmp / "data-registry.yaml"
+            ids = _write_registry(path, n)
+            reg = DatasetRegistry(path, journal=journal)
+            versions = iter(range(1, 10_000))
+
+            def op():
+                v = next(versions)
+                reg.upsert_version(
+                    ids[v % len(ids)],
+                    {
+                        "zenodo": {
+                            "versions": [
+                                {"version": f"1.{v}.0", "doi": f"10.5281/x.{v}"}
+                            ]
+                        }
+                    },
+                )
+
+            return Result("", _timed(op, 5), 1, "upserts")
+
+
+for _n in (10, 1_000, 10_000):
+    _registry_cases(_n)
+
+
+def _import_case(statement: str, repeat: int = 10) -> Case:
+    # a fresh interpreter per run, timing only the import itself
+    script = (
+        "import time\n"
+        "t0 = time.perf_counter()\n"
+        f"{statement}\n"
+        "print(time.perf_counter() - t0)\n"
+    )
+
+    def run(fake: FakeZenodo, tmp: Path) -> Result:
+        def once() -> float:
+            out = subprocess.run(
+                [sys.executable, "-c", script],
+                check=True,
+                capture_output=True,
+                text=True,
+                cwd=Path(__file__).resolve().parent.parent,
+            ).stdout
+            return float(out)
+
+        once()  # compile bytecode outside the timed runs
+        return Result("", [once() for _ in range(repeat)], 1, "imports")
+
+    return run
+
+
+# batch jobs import the package once per task; lookups must stay cheap
+case("import_package")(_import_case("import cogs_archive"))
+case("import_registry")(
+    _import_case("from cogs_archive.registry import DatasetRegistry")
+)
+case("import_publish")(_import_case("from cogs_archive.publish import publish"))
+
+
+def _settings(args: argparse.Namespace) -> dict:
+    return {
+        "latency_ms": args.latency_ms,
+        "bandwidth_mb_s": args.bandwidth_mb_s,
+        "failure_rate": args.failure_rate,
+    }
+
+
+def _machine() -> str:
+    # timings are only comparable on the same host and interpreter
+    return " ".join(
+        [
+            platform.node(),
+            platform.machine(),
+            platform.python_implementation(),
+            platform.python_version(),
+        ]
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    p.add_argument("--only", default="", help="run cases whose name contains this")
+    p.add_argument("--latency-ms", type=float, default=0.0)
+    p.add_argument("--bandwidth-mb-s", type=float, default=None)
+    p.add_argument("--failure-rate", type=float, default=0.0)
+    p.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="allowed slowdown of the median vs baseline (0.5 = 50%%)",
+    )
+    p.add_argument(
+        "--min-delta-ms",
+        type=float,
+        default=1.0,
+        help="ignore slowdowns smaller than this, which are timer noise",
+    )
+    p.add_argument("--update-baseline", action="store_true")
+    args = p.parse_args(argv)
+
+    settings = _settings(args)
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    comparable = (
+        baseline.get("settings") == settings and baseline.get("machine") == _machine()
+    )
+    if not args.update_baseline:
+        if not baseline:
+            print("no local baseline; record one with --update-baseline")
+        elif baseline.get("machine") != _machine():
+            print("baseline was recorded on another machine; not comparing")
+        elif not comparable:
+            print("server settings differ from the baseline's; not comparing")
+
+    fake = FakeZenodo(
+        latency_s=args.latency_ms / 1000,
+        bytes_per_s=int(args.bandwidth_mb_s * 1e6) if args.bandwidth_mb_s else None,
+        failure_rate=args.failure_rate,
+    )
+    results: dict[str, Result] = {}
+    regressions = []
+    print(f"{'case':32} {'median':>10} {'p95':>10} {'throughput':>16}  vs baseline")
+    with fake, tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(
+            ZENODO_ACCESS_TOKEN="bench-token",
+            ZENODO_BASE_URL=fake.base_url,
+            LABARCHIVE_CACHE_DIR=str(Path(tmp) / "cache"),
+            # measure our code, not the production API's request budget
+            LABARCHIVE_ZENODO_REQUESTS_PER_MIN="1000000",
+        )
+        for name, run in CASES.items():
+            if args.only not in name:
+                continue
+            case_dir = Path(tmp) / name
+            case_dir.mkdir()
+            _errors.clear()
+            res = run(fake, case_dir)
+            res.name = name
+            res.errors = len(_errors)
+            if not res.times:
+                print(f"{name:32} every operation failed: {_errors[-1]!r}")
+                regressions.append(name)
+                continue
+            results[name] = res
+
+            ref = baseline.get("cases", {}).get(name) if comparable else None
+            change = ""
+            if ref:
+                ratio = res.median / ref["median_s"]
+                change = f"{ratio - 1:+.0%}"
+                delta_ms = (res.median - ref["median_s"]) * 1e3
+                if ratio > 1 + args.tolerance and delta_ms > args.min_delta_ms:
+                    change += "  REGRESSION"
+                    regressions.append(name)
+            if res.errors:
+                change += f"  ({res.errors} failed: {_errors[-1]!r})"
+            print(
+                f"{name:32} {res.median * 1e3:8.2f}ms {res.p95 * 1e3:8.2f}ms "
+                f"{res.throughput:10.1f} {res.unit}/s  {change}"
+            )
+
+    if fake.failures:
+        print(f"injected failures: {fake.failures} of {fake.requests} requests")
+
+    if args.update_baseline:
+        cases = dict(baseline.get("cases", {})) if comparable else {}
+        cases.update(
+            {
+                name: {"median_s": r.median, "p95_s": r.p95, "unit": r.unit}
+                for name, r in results.items()
+            }
+        )
+        BASELINE.write_text(
+            json.dumps(
+                {"machine": _machine(), "settings": settings, "cases": cases},
+                indent=2,
+            )
+            + "\n"
+        )
+        print(f"baseline written to {BASELINE}")
+        return 0
+    if regressions:
+        print(f"regressed or failed: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,32 @@
+from __future__ import annotations
 from pathlib import Path
+from typing import TYPE_CHECKING
 from .config import load_config
-from .zenodo import ZenodoClient
-from .registry import DatasetRegistry
+
+if TYPE_CHECKING:
+    from .registry import DatasetRegistry
+    from .zenodo import ZenodoClient
+
+# Submodules are imported on first use so that registry lookups and cache hits
+# never load the HTTP stack; batch jobs import this package thousands of times.
+_LAZY = {
+    "DatasetRegistry": ".registry",
+    "ZenodoClient": ".zenodo",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        import importlib
+
+        value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(list(globals()) + list(_LAZY))
 
 
 def publish(
@@ -17,6 +42,9 @@ def publish(
     `metadata` should be Zenodo deposition metadata under the "metadata" key shape,
     e.g. title, upload_type="dataset", creators, description, license, keywords, etc.
     """
+    from .registry import DatasetRegistry
+    from .zenodo import ZenodoClient
+
     cfg = load_config()
     if not cfg.zenodo_access_token:
         raise RuntimeError("ZENODO_ACCESS_TOKEN is not set")
@@ -0,0 +1,137 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Callable
+import asyncio
+
+from .cache import BandwidthLimiter, Cache, ProgressCallback, shared_bandwidth_limiter
+from .config import load_config
+from .dataset import RegisteredDataset
+from .zenodo import Deposition, UploadDone, UploadProgress, ZenodoClient
+
+
+class AsyncZenodoClient:
+    """
+    Awaitable counterpart of ZenodoClient with the same methods.
+
+    Each call runs the blocking client in a worker thread, at most
+    `max_concurrency` at a time, so coroutines can drive many uploads at once
+    without stalling the event loop; retries and rate limiting are the
+    synchronous client's. `progress` callbacks are called from the worker
+    threads; upload_files' `on_done` runs on the event loop.
+    """
+
+    def __init__(
+        self,
+        access_token: str | None = None,
+        max_concurrency: int = 8,
+        client: ZenodoClient | None = None,
+        **client_kwargs: Any,
+    ):
+        if client is None:
+            if access_token is None:
+                raise ValueError("pass either access_token or client")
+            client_kwargs.setdefault("pool_size", max(10, max_concurrency))
+            client = ZenodoClient(access_token=access_token, **client_kwargs)
+        self.client = client
+        self._sem = asyncio.Semaphore(max_concurrency)
+
+    async def _call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        async with self._sem:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+
+    async def create_deposition(self) -> dict:
+        return await self._call(self.client.create_deposition)
+
+    async def update_metadata(self, deposition_id: int, metadata: dict) -> dict:
+        return await self._call(self.client.update_metadata, deposition_id, metadata)
+
+    async def open_deposition(self, deposition: int | dict | Deposition) -> Deposition:
+        return await self._call(self.client.open_deposition, deposition)
+
+    async def upload_file(
+        self,
+        deposition: int | Deposition,
+        file_path: Path,
+        progress: UploadProgress | None = None,
+    ) -> dict:
+        return await self._call(
+            self.client.upload_file, deposition, file_path, progress=progress
+        )
+
+    async def upload_files(
+        self,
+        deposition: int | Deposition,
+        files: list[Path],
+        progress: UploadProgress | None = None,
+        on_done: UploadDone | None = None,
+    ) -> list[dict]:
+        """
+        Upload several files into one deposition concurrently, bounded by
+        max_concurrency. Results are in the order of `files`. `on_done(fp,
+        response)` is called on the event loop as each upload finishes.
+        """
+        dep = await self.open_deposition(deposition)
+
+        async def upload_one(fp: Path) -> dict:
+            res = await self.upload_file(dep, fp, progress=progress)
+            if on_done is not None:
+                on_done(fp, res)
+            return res
+
+        return list(await asyncio.gather(*(upload_one(fp) for fp in files)))
+
+    async def publish(self, deposition_id: int) -> dict:
+        return await self._call(self.client.publish, deposition_id)
+
+    async def new_version(self, deposition_id: int) -> dict:
+        return await self._call(self.client.new_version, deposition_id)
+
+    async def delete_file(self, deposition_id: int, file_id: str) -> None:
+        await self._call(self.client.delete_file, deposition_id, file_id)
+
+    async def get_deposition(self, deposition_id: int) -> dict:
+        return await self._call(self.client.get_deposition, deposition_id)
+
+    async def get_record(self, recid: int) -> dict:
+        return await self._call(self.client.get_record, recid)
+
+
+async def fetch(
+    dataset: RegisteredDataset,
+    version: str | None = None,
+    cache: Cache | None = None,
+    max_concurrency: int | None = None,
+    progress: ProgressCallback | None = None,
+    limiter: BandwidthLimiter | None = None,
+    verify: str = "index",
+) -> list[Path]:
+    """
+    Awaitable RegisteredDataset.fetch(): downloads up to `max_concurrency`
+    files at once (default `Config.fetch_workers`) in worker threads, with the
+    same resuming, verification and caching, and returns the cached paths in
+    registry order.
+    """
+    cfg = load_config()
+    cache = cache or Cache.from_config(cfg)
+    sem = asyncio.Semaphore(max_concurrency or cfg.fetch_workers)
+    if limiter is None and cfg.max_bytes_per_s:
+        limiter = shared_bandwidth_limiter(cfg.max_bytes_per_s)
+
+    v, jobs = await asyncio.to_thread(dataset._plan_fetch, version, cache)
+
+    async def fetch_one(job: tuple[str, Path, str | None]) -> Path:
+        url, dest, checksum = job
+        async with sem:
+            return await asyncio.to_thread(
+                cache.fetch_file,
+                url,
+                dest,
+                checksum=checksum,
+                progress=progress,
+                limiter=limiter,
+                verify=verify,
+            )
+
+    out = list(await asyncio.gather(*(fetch_one(job) for job in jobs)))
+    await asyncio.to_thread(dataset._finish_fetch, cache, v, jobs)
+    return out
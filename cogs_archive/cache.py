@@ -1,38 +1,868 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Optional
 import hashlib
-import requests
+import io
+import os
+import queue
+import shutil
+import threading
+import time
 
+from . import metrics
+from .cache_index import CacheIndex, ViewEntry
 from .exceptions import ChecksumError
+from .locking import file_lock, try_file_lock
+
+if TYPE_CHECKING:
+    # requests is imported by the download paths only, so cache hits never
+    # load the HTTP stack
+    import requests
+
+    from .config import Config
+    from .http import RateLimiter
+
+# progress(filename, bytes_done, bytes_total); total is None when the server
+# does not send a Content-Length. Called from download worker threads.
+ProgressCallback = Callable[[str, int, Optional[int]], None]
+
+
+class BandwidthLimiter:
+    """
+    Token bucket shared by every download thread of a fetch, so the combined
+    transfer rate stays under `bytes_per_s`.
+    """
+
+    def __init__(self, bytes_per_s: int):
+        if bytes_per_s <= 0:
+            raise ValueError("bytes_per_s must be positive")
+        self.bytes_per_s = bytes_per_s
+        self._allowance = float(bytes_per_s)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(
+                float(self.bytes_per_s),
+                self._allowance + (now - self._last) * self.bytes_per_s,
+            )
+            self._last = now
+            self._allowance -= nbytes
+            # a negative allowance is debt; pay it off before the next chunk
+            wait = -self._allowance / self.bytes_per_s if self._allowance < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+_bandwidth_limiters: dict[int, BandwidthLimiter] = {}
+_bandwidth_lock = threading.Lock()
+
+
+def shared_bandwidth_limiter(bytes_per_s: int) -> BandwidthLimiter:
+    """
+    The process-wide limiter for `bytes_per_s`, so concurrent fetches that
+    apply the configured cap share one budget instead of each getting its own.
+    """
+    with _bandwidth_lock:
+        limiter = _bandwidth_limiters.get(bytes_per_s)
+        if limiter is None:
+            limiter = _bandwidth_limiters[bytes_per_s] = BandwidthLimiter(bytes_per_s)
+        return limiter
+
+
+@dataclass(frozen=True)
+class VersionUsage:
+    dataset_id: str
+    version: str
+    size: int
+    last_access: float
+    pinned: bool
+
+
+@dataclass(frozen=True)
+class CacheUsage:
+    # bytes on disk, counting content shared between versions once
+    total_bytes: int
+    max_bytes: int | None
+    # least recently used first
+    versions: list[VersionUsage]
+
+
+@dataclass(frozen=True)
+class GcReport:
+    evicted: list[tuple[str, str]]
+    freed_bytes: int
+    usage: CacheUsage
 
 
 @dataclass(frozen=True)
 class Cache:
     cache_dir: Path
+    # byte budget enforced by gc(); None means unbounded
+    max_bytes: int | None = None
+    # pooled session for downloads; defaults to the process-wide one
+    session: requests.Session | None = field(default=None, compare=False, repr=False)
+    # paces download requests; defaults to the process-wide one for the host
+    rate_limiter: RateLimiter | None = field(default=None, compare=False, repr=False)
+    # where the SQLite index lives; None keeps it in cache_dir. Point it at
+    # node-local disk when cache_dir is shared over NFS, where SQLite's
+    # locking cannot be trusted
+    index_dir: Path | None = None
 
-    def path_for(self, dataset_id: str, filename: str, version: str) -> Path:
+    @classmethod
+    def from_config(cls, cfg: Config) -> Cache:
+        return cls(
+            cfg.cache_dir,
+            max_bytes=cfg.cache_max_bytes,
+            index_dir=cfg.cache_index_dir,
+        )
+
+    def _version_dir(self, dataset_id: str, version: str) -> Path:
         safe = dataset_id.replace(":", "_").replace("/", "_")
-        p = self.cache_dir / safe / version
+        return self.cache_dir / safe / version
+
+    def path_for(self, dataset_id: str, filename: str, version: str) -> Path:
+        p = self._version_dir(dataset_id, version)
         p.mkdir(parents=True, exist_ok=True)
         return p / filename
 
+    def object_path(self, checksum: str) -> Path:
+        # content-addressed store: objects/<algo>/<first two hex>/<hex>
+        algo, hexdigest = checksum.split(":", 1)
+        return self.cache_dir / "objects" / algo / hexdigest[:2] / hexdigest
+
+    def fetch_file(
+        self,
+        url: str,
+        dest: Path,
+        checksum: str | None = None,
+        progress: ProgressCallback | None = None,
+        limiter: BandwidthLimiter | None = None,
+        verify: str = "index",
+    ) -> Path:
+        """
+        Make a verified copy of `url` available at `dest` (a path_for() view).
+
+        Files with a registry checksum are stored once under object_path() and
+        `dest` is a hardlink to that object (symlink or copy where hardlinks are
+        unsupported), so content shared between versions is downloaded and
+        stored only once. Files without a checksum are downloaded to `dest`.
+
+        Several threads or processes (e.g. cluster jobs sharing the cache
+        directory over NFS) may fetch the same file at once: one downloads
+        under an advisory lock while the others wait, then find the verified
+        file in place.
+        """
+        if not checksum:
+            if not dest.exists():
+                with file_lock(self._lock_path(dest)):
+                    if not dest.exists():
+                        metrics.count("cache.misses")
+                        self.download(url, dest, progress=progress, limiter=limiter)
+                        return dest
+            metrics.count("cache.hits")
+            return dest
+
+        obj = self.object_path(checksum)
+        stored = False
+        if not obj.exists():
+            with file_lock(self._lock_path(obj)):
+                if not obj.exists():
+                    self._store_object(
+                        url, obj, dest, checksum, progress, limiter, verify
+                    )
+                    stored = True
+        if not stored:
+            metrics.count("cache.hits")
+            self.ensure_verified(obj, checksum, verify=verify)
+
+        if not (dest.exists() and os.path.samefile(dest, obj)):
+            _link(obj, dest)
+        return dest
+
+    def _store_object(
+        self,
+        url: str,
+        obj: Path,
+        dest: Path,
+        checksum: str,
+        progress: ProgressCallback | None,
+        limiter: BandwidthLimiter | None,
+        verify: str,
+    ) -> None:
+        # caller holds the object's lock
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists():
+            metrics.count("cache.hits")
+            # cached before the object store existed: adopt the file as-is
+            self.ensure_verified(dest, checksum, verify=verify)
+            os.replace(dest, obj)
+            self.index.record(obj, checksum)
+            return
+        metrics.count("cache.misses")
+        self.download(
+            url,
+            obj,
+            progress=_renamed(progress, dest.name),
+            limiter=limiter,
+            checksum=checksum,
+        )
+
+    def _lock_path(self, path: Path) -> Path:
+        # advisory lock guarding one cached file, kept out of the data dirs
+        rel = os.path.relpath(path, self.cache_dir)
+        name = hashlib.sha1(rel.encode("utf-8")).hexdigest()
+        lock_dir = self.cache_dir / ".locks" / name[:2]
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        return lock_dir / f"{name}.lock"
+
+    def stream(
+        self,
+        url: str,
+        dest: Path,
+        checksum: str | None = None,
+        tee: bool = False,
+        read_ahead: int = 8 * 1024 * 1024,
+        limiter: BandwidthLimiter | None = None,
+        on_complete: Callable[[], None] | None = None,
+    ) -> "DownloadStream":
+        """
+        Read `url` as a stream without waiting for a full local copy.
+
+        With `tee`, the bytes are also written into the cache as fetch_file()
+        would store them (object store plus `dest` view), and `on_complete` is
+        called once that copy is verified and in place. The tee downloads at
+        network speed, whatever the reader's pace, and holds the file's
+        download lock only until the copy is complete; if another thread or
+        process holds it (e.g. a fetch_file() of the same object) the stream
+        is read without a copy. A stream closed early leaves a `.part` that a
+        later download resumes.
+        """
+        target = lock = None
+        if tee:
+            target = self.object_path(checksum) if checksum else dest
+            target.parent.mkdir(parents=True, exist_ok=True)
+            lock = self._lock_path(target)
+
+        def complete(digest: str) -> None:
+            if target is None:
+                return
+            self.index.record(target, digest)
+            if target != dest:
+                _link(target, dest)
+            if on_complete is not None:
+                on_complete()
+
+        return DownloadStream(
+            url,
+            checksum=checksum,
+            session=self.session,
+            tee=target,
+            tee_lock=lock,
+            read_ahead=read_ahead,
+            limiter=limiter,
+            rate_limiter=self.rate_limiter,
+            on_complete=complete,
+        )
+
+    def record_access(
+        self, dataset_id: str, version: str, files: list[tuple[Path, str | None]]
+    ) -> None:
+        """Mark the (view path, checksum) pairs of a version as just used."""
+        now = time.time()
+        entries = []
+        for dest, checksum in files:
+            storage = self.object_path(checksum) if checksum else dest
+            try:
+                size = storage.stat().st_size
+            except FileNotFoundError:
+                # evicted by a concurrent gc(); the next fetch stores and
+                # records it again
+                continue
+            entries.append(
+                ViewEntry(
+                    path=os.path.abspath(dest),
+                    dataset_id=dataset_id,
+                    version=version,
+                    storage=os.path.abspath(storage),
+                    size=size,
+                    last_access=now,
+                )
+            )
+        self.index.touch(entries)
+
+    def pin(self, dataset_id: str, version: str) -> None:
+        """Exempt a dataset version from eviction."""
+        self.index.pin(dataset_id, version)
+
+    def unpin(self, dataset_id: str, version: str) -> None:
+        self.index.unpin(dataset_id, version)
+
+    def usage(self) -> CacheUsage:
+        views = self.index.views()
+        pins = self.index.pins()
+        storage = {v.storage: v.size for v in views}
+        by_version: dict[tuple[str, str], tuple[int, float]] = {}
+        for v in views:
+            size, last = by_version.get((v.dataset_id, v.version), (0, 0.0))
+            by_version[(v.dataset_id, v.version)] = (
+                size + v.size,
+                max(last, v.last_access),
+            )
+        versions = [
+            VersionUsage(ds, ver, size, last, (ds, ver) in pins)
+            for (ds, ver), (size, last) in sorted(
+                by_version.items(), key=lambda kv: kv[1][1]
+            )
+        ]
+        return CacheUsage(sum(storage.values()), self.max_bytes, versions)
+
+    def gc(
+        self,
+        max_bytes: int | None = None,
+        keep: list[tuple[str, str]] | None = None,
+    ) -> GcReport:
+        """
+        Evict least recently used dataset versions until the cache fits in
+        `max_bytes` (default: self.max_bytes). Pinned versions and those in
+        `keep` are never evicted. Shared objects are deleted only once no
+        remaining version uses them.
+        """
+        budget = self.max_bytes if max_bytes is None else max_bytes
+        usage = self.usage()
+        if budget is None or usage.total_bytes <= budget:
+            return GcReport([], 0, usage)
+
+        keep_set = set(keep or [])
+        views = self.index.views()
+        refs: dict[str, set[tuple[str, str]]] = {}
+        for v in views:
+            refs.setdefault(v.storage, set()).add((v.dataset_id, v.version))
+
+        total = usage.total_bytes
+        evicted = []
+        for vu in usage.versions:
+            if total <= budget:
+                break
+            key = (vu.dataset_id, vu.version)
+            if vu.pinned or key in keep_set:
+                continue
+            for v in views:
+                if (v.dataset_id, v.version) != key:
+                    continue
+                Path(v.path).unlink(missing_ok=True)
+                refs[v.storage].discard(key)
+                if not refs[v.storage]:
+                    # not while another process is (re)storing the object
+                    lock = self._lock_path(Path(v.storage))
+                    with file_lock(lock):
+                        Path(v.storage).unlink(missing_ok=True)
+                        self.index.forget(Path(v.storage))
+                        lock.unlink(missing_ok=True)
+                    total -= v.size
+                if v.storage != v.path:
+                    self.index.forget(Path(v.path))
+            self.index.drop_version(*key)
+            try:
+                self._version_dir(*key).rmdir()
+            except OSError:
+                pass  # not empty (untracked files) or already gone
+            evicted.append(key)
+
+        return GcReport(evicted, usage.total_bytes - total, self.usage())
+
+    @property
+    def index(self) -> CacheIndex:
+        if self.index_dir is None:
+            return CacheIndex(self.cache_dir / ".cache-index.sqlite")
+        # one index per cache, so several caches can share an index_dir
+        name = hashlib.sha1(os.path.abspath(self.cache_dir).encode()).hexdigest()
+        return CacheIndex(self.index_dir / f"cache-index-{name[:16]}.sqlite")
+
     def verify_checksum(self, file_path: Path, checksum: str) -> None:
         # checksum expected like "md5:<hex>" (Zenodo commonly uses md5)
         algo, hex_expected = checksum.split(":", 1)
         h = hashlib.new(algo)
-        with file_path.open("rb") as f:
+        with metrics.span("cache.hash", algo=algo), file_path.open("rb") as f:
             for chunk in iter(lambda: f.read(1024 * 1024), b""):
                 h.update(chunk)
         if h.hexdigest() != hex_expected:
+            self.index.forget(file_path)
             raise ChecksumError(
                 f"Checksum mismatch for {file_path.name}: expected {checksum}, got {algo}:{h.hexdigest()}"
             )
+        self.index.record(file_path, checksum)
+
+    def ensure_verified(
+        self, file_path: Path, checksum: str, verify: str = "index"
+    ) -> None:
+        """
+        Check a cached file against `checksum`. With verify="index" a file the
+        index already vouches for (same size, mtime and inode) is not re-read;
+        verify="full" always re-hashes it.
+        """
+        if verify not in ("index", "full"):
+            raise ValueError(f"Unknown verify mode: {verify}")
+        if verify == "index" and self.index.is_verified(file_path, checksum):
+            return
+        self.verify_checksum(file_path, checksum)
+
+    def download(
+        self,
+        url: str,
+        dest: Path,
+        progress: ProgressCallback | None = None,
+        limiter: BandwidthLimiter | None = None,
+        retries: int = 5,
+        checksum: str | None = None,
+    ) -> str:
+        """
+        Stream `url` into `dest` via a sibling `.part` file that is renamed into
+        place only once complete, so `dest` never exists half-written. Dropped
+        connections resume from the bytes already on disk with a Range request,
+        including a `.part` left behind by an earlier process.
 
-    def download(self, url: str, dest: Path) -> None:
-        with requests.get(url, stream=True, timeout=120) as r:
+        The file is hashed as it streams in. If `checksum` ("algo:hex") is given
+        a mismatch discards the download and raises ChecksumError; either way
+        the digest of the renamed file is returned, e.g. "md5:<hex>".
+
+        Requests are paced by the rate limiter. A 429 is retried once the
+        limiter allows, which is after the server's Retry-After.
+        """
+        part = dest.with_name(dest.name + ".part")
+        algo = checksum.split(":", 1)[0] if checksum else "md5"
+        state = _StreamHash(algo)
+        transient = _transient_errors()
+        attempt = 0
+        with metrics.span("cache.download", url=url):
+            while True:
+                try:
+                    self._download_part(url, part, state, progress, limiter)
+                    break
+                except transient as exc:
+                    attempt += 1
+                    _retry_or_raise(exc, attempt, retries)
+
+        digest = f"{algo}:{state.hasher.hexdigest()}"
+        if checksum and digest != checksum:
+            part.unlink()
+            raise ChecksumError(
+                f"Checksum mismatch for {dest.name}: expected {checksum}, got {digest}"
+            )
+        os.replace(part, dest)
+        self.index.record(dest, digest)
+        return digest
+
+    def _download_part(
+        self,
+        url: str,
+        part: Path,
+        state: _StreamHash,
+        progress: ProgressCallback | None,
+        limiter: BandwidthLimiter | None,
+    ) -> None:
+        import requests
+        from .http import default_session, download_rate_limiter
+
+        offset = part.stat().st_size if part.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        session = self.session or default_session()
+        rate_limiter = self.rate_limiter or download_rate_limiter(url)
+        rate_limiter.acquire()
+        with session.get(url, stream=True, timeout=120, headers=headers) as r:
+            delay = rate_limiter.observe(r)
+            if r.status_code == 429:
+                raise _RateLimited(r, delay)
+            if r.status_code == 416:
+                # nothing left to send: either the .part is already complete
+                # (crash before rename) or it is longer than the remote file
+                size = r.headers.get("Content-Range", "").rpartition("/")[2]
+                if size.isdigit() and int(size) == offset:
+                    state.catch_up(part, offset)
+                    return
+                part.unlink()
+                return self._download_part(url, part, state, progress, limiter)
+            r.raise_for_status()
+            if r.status_code != 206:
+                # server ignored the Range header; start over
+                offset = 0
+            state.catch_up(part, offset)
+            length = r.headers.get("Content-Length")
+            total = int(length) + offset if length is not None else None
+            done = offset
+            # split disk and hash time only when someone is listening
+            timed = metrics.enabled()
+            write_s = hash_s = 0.0
+            try:
+                with part.open("ab" if offset else "wb") as f:
+                    for chunk in r.iter_content(chunk_size=1024 * 1024):
+                        if not chunk:
+                            continue
+                        if limiter is not None:
+                            limiter.consume(len(chunk))
+                        if timed:
+                            t0 = time.perf_counter()
+                            f.write(chunk)
+                            t1 = time.perf_counter()
+                            state.update(chunk)
+                            write_s += t1 - t0
+                            hash_s += time.perf_counter() - t1
+                        else:
+                            f.write(chunk)
+                            state.update(chunk)
+                        done += len(chunk)
+                        if progress is not None:
+                            progress(part.name.removesuffix(".part"), done, total)
+            finally:
+                if timed:
+                    metrics.count("cache.bytes_received", done - offset)
+                    metrics.count("cache.write_seconds", write_s)
+                    metrics.count("cache.hash_seconds", hash_s)
+            if total is not None and done < total:
+                # connection closed early without an error from requests
+                raise requests.exceptions.ChunkedEncodingError(
+                    f"Incomplete download of {url}: {done} of {total} bytes"
+                )
+
+
+_EOF = object()
+# first queue item of a teeing stream: read the .part back from disk instead
+_TEE = object()
+
+
+class DownloadStream(io.RawIOBase):
+    """
+    Readable binary stream over an HTTP download.
+
+    A background thread downloads the body, hashing it as it arrives.
+    Without a tee it keeps up to `read_ahead` bytes queued ahead of the
+    reader. With `tee` it writes the body to `<tee>.part` as fast as the
+    network allows and read() reads it back from that file, so a slow or
+    stalled reader never holds up the download. Dropped connections are
+    resumed with a Range request. At the end of the body the digest is
+    checked against `checksum`: on a mismatch read() raises ChecksumError
+    and nothing is kept; otherwise the `.part` is renamed to `tee` and
+    `on_complete(digest)` runs before read() reports EOF.
+
+    With `tee_lock`, that lock is held (by the background thread) while the
+    tee downloads. If it is taken, or `tee` already exists, nothing is
+    written. Any error in the background thread is raised by read().
+    """
+
+    _chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        url: str,
+        checksum: str | None = None,
+        session: requests.Session | None = None,
+        tee: Path | None = None,
+        tee_lock: Path | None = None,
+        read_ahead: int = 8 * 1024 * 1024,
+        limiter: BandwidthLimiter | None = None,
+        on_complete: Callable[[str], None] | None = None,
+        retries: int = 5,
+        rate_limiter: RateLimiter | None = None,
+    ):
+        from .http import default_session, download_rate_limiter
+
+        super().__init__()
+        self.url = url
+        self.checksum = checksum
+        self._session = session or default_session()
+        self._rate_limiter = rate_limiter or download_rate_limiter(url)
+        self._tee = tee
+        self._tee_lock = tee_lock
+        self._limiter = limiter
+        self._on_complete = on_complete
+        self._retries = retries
+        self._queue: queue.Queue = queue.Queue(
+            maxsize=max(1, read_ahead // self._chunk_size)
+        )
+        self._buf = memoryview(b"")
+        self._done = False
+        self._stop = threading.Event()
+        # teeing: bytes flushed to the .part, and _EOF or the error once the
+        # background thread is finished with it
+        self._teeing = False
+        self._part_reader: io.RawIOBase | None = None
+        self._cond = threading.Condition()
+        self._written = 0
+        self._end = None
+        self._from_part = False
+        self._read = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed stream")
+        if self._from_part:
+            return self._read_part(b)
+        if not self._buf:
+            if self._done:
+                return 0
+            item = self._queue.get()
+            if item is _TEE:
+                self._from_part = True
+                return self._read_part(b)
+            if item is _EOF:
+                self._done = True
+                return 0
+            if isinstance(item, BaseException):
+                self._done = True
+                raise item
+            self._buf = memoryview(item)
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def _read_part(self, b) -> int:
+        if self._done:
+            return 0
+        with self._cond:
+            while self._read == self._written and self._end is None:
+                self._cond.wait()
+            available = self._written - self._read
+            end = self._end
+        if available:
+            n = self._part_reader.readinto(memoryview(b)[:available])
+            self._read += n
+            return n
+        self._done = True
+        if end is _EOF:
+            return 0
+        raise end
+
+    def close(self) -> None:
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            if self._part_reader is not None:
+                self._part_reader.close()
+        super().close()
+
+    def _put(self, item) -> bool:
+        # False once the reader has closed the stream
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _finish(self, end) -> None:
+        # hand the reader _EOF or the error to raise after the bytes before it
+        if not self._teeing:
+            self._put(end)
+            return
+        with self._cond:
+            if self._end is None:
+                self._end = end
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        try:
+            if self._tee is None or self._tee_lock is None:
+                return self._transfer(self._tee)
+            with try_file_lock(self._tee_lock) as locked:
+                # otherwise another download is writing the same .part (or
+                # has finished it); read through without touching it
+                keep = locked and not self._tee.exists()
+                self._transfer(self._tee if keep else None)
+        except BaseException as exc:
+            self._finish(exc)
+
+    def _transfer(self, tee: Path | None) -> None:
+        algo = self.checksum.split(":", 1)[0] if self.checksum else "md5"
+        state = _StreamHash(algo)
+        if tee is None:
+            if self._pump_all(state, self._put):
+                self._check(state, algo)
+                self._finish(_EOF)
+            return
+
+        part = tee.with_name(tee.name + ".part")
+        with part.open("wb") as out:
+            self._part_reader = open(part, "rb", buffering=0)
+            self._teeing = True
+            if not self._put(_TEE):
+                return  # closed by the reader
+
+            def sink(chunk: bytes) -> bool:
+                out.write(chunk)
+                out.flush()
+                with self._cond:
+                    self._written += len(chunk)
+                    self._cond.notify_all()
+                return not self._stop.is_set()
+
+            if not self._pump_all(state, sink):
+                return
+        try:
+            digest = self._check(state, algo)
+        except ChecksumError:
+            part.unlink()
+            raise
+        os.replace(part, tee)
+        if self._on_complete is not None:
+            self._on_complete(digest)
+        self._finish(_EOF)
+
+    def _check(self, state: _StreamHash, algo: str) -> str:
+        digest = f"{algo}:{state.hasher.hexdigest()}"
+        if self.checksum and digest != self.checksum:
+            raise ChecksumError(
+                f"Checksum mismatch for {self.url}: "
+                f"expected {self.checksum}, got {digest}"
+            )
+        return digest
+
+    def _pump_all(self, state: _StreamHash, sink: Callable[[bytes], bool]) -> bool:
+        # False if the reader closed the stream before the body was complete
+        transient = _transient_errors()
+        attempt = 0
+        while True:
+            try:
+                return self._pump(state, sink)
+            except transient as exc:
+                attempt += 1
+                _retry_or_raise(exc, attempt, self._retries)
+
+    def _pump(self, state: _StreamHash, sink: Callable[[bytes], bool]) -> bool:
+        import requests
+
+        offset = state.nbytes
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        self._rate_limiter.acquire()
+        with self._session.get(
+            self.url, stream=True, timeout=120, headers=headers
+        ) as r:
+            delay = self._rate_limiter.observe(r)
+            if r.status_code == 429:
+                raise _RateLimited(r, delay)
             r.raise_for_status()
-            with dest.open("wb") as f:
-                for chunk in r.iter_content(chunk_size=1024 * 1024):
-                    if chunk:
-                        f.write(chunk)
+            # a server that ignores Range resends bytes we already have
+            skip = offset if offset and r.status_code != 206 else 0
+            length = r.headers.get("Content-Length")
+            expected = int(length) - skip if length is not None else None
+            got = 0
+            try:
+                for chunk in r.iter_content(chunk_size=self._chunk_size):
+                    if skip:
+                        dropped = min(skip, len(chunk))
+                        chunk, skip = chunk[dropped:], skip - dropped
+                    if not chunk:
+                        continue
+                    if self._limiter is not None:
+                        self._limiter.consume(len(chunk))
+                    state.update(chunk)
+                    got += len(chunk)
+                    if not sink(chunk):
+                        return False
+            finally:
+                metrics.count("cache.bytes_received", got)
+            if expected is not None and got < expected:
+                # connection closed early without an error from requests
+                raise requests.exceptions.ChunkedEncodingError(
+                    f"Incomplete download of {self.url}"
+                )
+        return True
+
+
+class _RateLimited(Exception):
+    """A 429 answer to a download request."""
+
+    def __init__(self, response: requests.Response, delay: float | None):
+        super().__init__(f"Rate limited: {response.status_code} for {response.url}")
+        self.response = response
+        # the pause observe() imposed from the response headers, if any
+        self.delay = delay
+
+
+def _transient_errors() -> tuple[type[Exception], ...]:
+    # failures after which a download resumes with a Range request
+    import requests
+
+    return (
+        requests.ConnectionError,
+        requests.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        _RateLimited,
+    )
+
+
+def _retry_or_raise(exc: Exception, attempt: int, retries: int) -> None:
+    # back off before retry `attempt` of a download, or give up
+    if attempt > retries:
+        if isinstance(exc, _RateLimited):
+            # the HTTPError a caller of raise_for_status() would expect
+            exc.response.raise_for_status()
+        raise exc
+    metrics.count("cache.retries")
+    if isinstance(exc, _RateLimited) and exc.delay is not None:
+        return  # the paused rate limiter holds the next request back
+    time.sleep(min(2**attempt, 30))
+
+
+def _renamed(progress: ProgressCallback | None, name: str):
+    # report object downloads under the view's filename, not the hex digest
+    if progress is None:
+        return None
+    return lambda _, done, total: progress(name, done, total)
+
+
+def _link(src: Path, dest: Path) -> None:
+    # build the link beside dest and rename it over, so a concurrent reader
+    # never sees a missing or partial view; the random suffix keeps processes
+    # linking the same view (on any host) out of each other's way
+    tmp = dest.with_name(f"{dest.name}.{os.urandom(6).hex()}.link")
+    try:
+        try:
+            os.link(src, tmp)
+        except OSError:
+            try:
+                os.symlink(os.path.abspath(src), tmp)
+            except OSError:
+                shutil.copy2(src, tmp)
+        os.replace(tmp, dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+class _StreamHash:
+    """Running digest of the bytes written to a `.part` file."""
+
+    def __init__(self, algo: str):
+        self.algo = algo
+        self.hasher = hashlib.new(algo)
+        self.nbytes = 0
+
+    def update(self, chunk: bytes) -> None:
+        self.hasher.update(chunk)
+        self.nbytes += len(chunk)
+
+    def catch_up(self, part: Path, offset: int) -> None:
+        # Resuming within one download() call the digest already covers the
+        # first `offset` bytes. Only a .part inherited from an earlier process
+        # (or a restart from zero) needs the prefix re-read from disk.
+        if self.nbytes == offset:
+            return
+        self.hasher = hashlib.new(self.algo)
+        self.nbytes = 0
+        if offset:
+            with part.open("rb") as f:
+                while self.nbytes < offset:
+                    chunk = f.read(min(1024 * 1024, offset - self.nbytes))
+                    if not chunk:
+                        break
+                    self.update(chunk)
@@ -0,0 +1,153 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+import os
+import sqlite3
+import threading
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verified (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    checksum TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS views (
+    path TEXT PRIMARY KEY,
+    dataset_id TEXT NOT NULL,
+    version TEXT NOT NULL,
+    storage TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pins (
+    dataset_id TEXT NOT NULL,
+    version TEXT NOT NULL,
+    PRIMARY KEY (dataset_id, version)
+);
+"""
+
+
+# index files whose tables this process has already created
+_initialized: set[Path] = set()
+_initialized_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class ViewEntry:
+    """A file exposed under <dataset>/<version>/ and the storage backing it."""
+
+    path: str
+    dataset_id: str
+    version: str
+    storage: str
+    size: int
+    last_access: float
+
+
+@dataclass(frozen=True)
+class CacheIndex:
+    """
+    SQLite bookkeeping for the cache.
+
+    `verified` records files whose checksum has already been checked; an entry
+    stays valid while the file's size, mtime and inode are unchanged, so a warm
+    fetch costs one stat() per file instead of re-hashing it. `views` and
+    `pins` track what each dataset version occupies and when it was last used,
+    for size-bounded eviction.
+    """
+
+    db_path: Path
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # one short-lived connection per call keeps the index usable from the
+        # fetch worker threads and from several processes at once; the tables
+        # are created once per process, or again if the file was deleted
+        new = self.db_path not in _initialized or not self.db_path.exists()
+        if new:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            if new:
+                conn.executescript(_SCHEMA)
+                with _initialized_lock:
+                    _initialized.add(self.db_path)
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def is_verified(self, file_path: Path, checksum: str) -> bool:
+        try:
+            st = os.stat(file_path)
+        except FileNotFoundError:
+            return False
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT size, mtime_ns, inode, checksum FROM verified WHERE path = ?",
+                (os.path.abspath(file_path),),
+            ).fetchone()
+        return row == (st.st_size, st.st_mtime_ns, st.st_ino, checksum)
+
+    def record(self, file_path: Path, checksum: str) -> None:
+        st = os.stat(file_path)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO verified VALUES (?, ?, ?, ?, ?)",
+                (
+                    os.path.abspath(file_path),
+                    st.st_size,
+                    st.st_mtime_ns,
+                    st.st_ino,
+                    checksum,
+                ),
+            )
+
+    def forget(self, file_path: Path) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM verified WHERE path = ?", (os.path.abspath(file_path),)
+            )
+
+    def touch(self, entries: list[ViewEntry]) -> None:
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO views VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (e.path, e.dataset_id, e.version, e.storage, e.size, e.last_access)
+                    for e in entries
+                ],
+            )
+
+    def views(self) -> list[ViewEntry]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM views").fetchall()
+        return [ViewEntry(*row) for row in rows]
+
+    def drop_version(self, dataset_id: str, version: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM views WHERE dataset_id = ? AND version = ?",
+                (dataset_id, version),
+            )
+
+    def pin(self, dataset_id: str, version: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO pins VALUES (?, ?)", (dataset_id, version)
+            )
+
+    def unpin(self, dataset_id: str, version: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM pins WHERE dataset_id = ? AND version = ?",
+                (dataset_id, version),
+            )
+
+    def pins(self) -> set[tuple[str, str]]:
+        with self._connect() as conn:
+            return set(conn.execute("SELECT dataset_id, version FROM pins"))
@@ -9,6 +9,33 @@ class Config:
     zenodo_base_url: str = "https://zenodo.org/api"
     registry_path: Path = Path("data-registry.yaml")
     cache_dir: Path = Path.home() / ".cache" / "labarchive"
+    # concurrent downloads per fetch() and an optional process-wide bandwidth cap
+    fetch_workers: int = 4
+    max_bytes_per_s: int | None = None
+    # concurrent file uploads per publish()
+    upload_workers: int = 4
+    # cache byte budget; least recently used versions are evicted past it
+    cache_max_bytes: int | None = None
+    # node-local directory for the cache index when cache_dir is shared
+    cache_index_dir: Path | None = None
+    # append registry updates to a sidecar journal instead of rewriting it
+    registry_journal: bool = False
+    # Zenodo API request budget per token
+    zenodo_requests_per_min: int = 100
+
+
+def _int_env(name: str, default: int | None) -> int | None:
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return default
+    return int(raw)
+
+
+def _bool_env(name: str, default: bool) -> bool:
+    raw = os.getenv(name, "").strip().lower()
+    if not raw:
+        return default
+    return raw in ("1", "true", "yes", "on")
 
 
 def load_config() -> Config:
@@ -18,9 +45,17 @@ def load_config() -> Config:
     cache = Path(
         os.getenv("LABARCHIVE_CACHE_DIR", str(Path.home() / ".cache" / "labarchive"))
     )
+    index_dir = os.getenv("LABARCHIVE_CACHE_INDEX_DIR", "").strip()
     return Config(
         zenodo_access_token=token,
         zenodo_base_url=base,
         registry_path=reg,
         cache_dir=cache,
+        fetch_workers=_int_env("LABARCHIVE_FETCH_WORKERS", 4),
+        max_bytes_per_s=_int_env("LABARCHIVE_MAX_BYTES_PER_S", None),
+        upload_workers=_int_env("LABARCHIVE_UPLOAD_WORKERS", 4),
+        cache_max_bytes=_int_env("LABARCHIVE_CACHE_MAX_BYTES", None),
+        cache_index_dir=Path(index_dir) if index_dir else None,
+        registry_journal=_bool_env("LABARCHIVE_REGISTRY_JOURNAL", False),
+        zenodo_requests_per_min=_int_env("LABARCHIVE_ZENODO_REQUESTS_PER_MIN", 100),
     )
@@ -1,8 +1,14 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from pathlib import Path
+from typing import BinaryIO
+import io
+import mmap
+import os
+import struct
+import zipfile
 
-from .cache import Cache
+from .cache import BandwidthLimiter, Cache, ProgressCallback, shared_bandwidth_limiter
 from .config import load_config
 from .exceptions import RegistryError
 
@@ -50,44 +56,224 @@ class RegisteredDataset:
             )
         raise ValueError(f"Unknown style: {style}")
 
-    def fetch(
-        self, version: str | None = None, cache: Cache | None = None
-    ) -> list[Path]:
-        cfg = load_config()
-        cache = cache or Cache(cfg.cache_dir)
-
+    def _resolve_version(self, version: str | None) -> dict:
         z = self.spec.get("zenodo", {})
         versions = z.get("versions", [])
         if not versions:
             raise RegistryError(f"No versions registered for {self.dataset_id}")
 
-        v = None
         if version is None:
-            v = versions[-1]
+            return versions[-1]
+        for cand in versions:
+            if cand.get("version") == version:
+                return cand
+        raise RegistryError(f"Version {version} not found for {self.dataset_id}")
+
+    def fetch(
+        self,
+        version: str | None = None,
+        cache: Cache | None = None,
+        workers: int | None = None,
+        progress: ProgressCallback | None = None,
+        limiter: BandwidthLimiter | None = None,
+        verify: str = "index",
+    ) -> list[Path]:
+        """
+        Download (if needed) and verify every file of a version; returns the
+        cached paths in registry order.
+
+        Files are fetched concurrently by up to `workers` threads (default
+        `Config.fetch_workers`). `limiter` caps the combined transfer rate; when
+        omitted the process-wide one for `Config.max_bytes_per_s` is used if
+        that is set. `progress` is called from the worker threads.
+
+        Already-cached files are trusted if the cache index recorded them as
+        verified and they are unchanged on disk; pass verify="full" to re-hash
+        every file regardless.
+        """
+        cfg = load_config()
+        cache = cache or Cache.from_config(cfg)
+        workers = workers or cfg.fetch_workers
+        if limiter is None and cfg.max_bytes_per_s:
+            limiter = shared_bandwidth_limiter(cfg.max_bytes_per_s)
+
+        v, jobs = self._plan_fetch(version, cache)
+
+        def fetch_one(job: tuple[str, Path, str | None]) -> Path:
+            url, dest, checksum = job
+            return cache.fetch_file(
+                url,
+                dest,
+                checksum=checksum,
+                progress=progress,
+                limiter=limiter,
+                verify=verify,
+            )
+
+        if workers <= 1 or len(jobs) <= 1:
+            out = [fetch_one(job) for job in jobs]
         else:
-            for cand in versions:
-                if cand.get("version") == version:
-                    v = cand
-                    break
-        if v is None:
-            raise RegistryError(f"Version {version} not found for {self.dataset_id}")
-
-        out = []
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+                # map() preserves input order and re-raises the first failure
+                out = list(pool.map(fetch_one, jobs))
+
+        self._finish_fetch(cache, v, jobs)
+        return out
+
+    def open(
+        self,
+        filename: str,
+        member: str | None = None,
+        version: str | None = None,
+        cache: Cache | None = None,
+    ) -> BinaryIO:
+        """
+        Open one verified cached file (fetched first if needed) for binary
+        reading. With `member`, open that file inside the ZIP archive instead;
+        it is decompressed as it is read, without extracting to disk.
+        """
+        path = self._cached_file(filename, version, cache)
+        if member is None:
+            return path.open("rb")
+        with zipfile.ZipFile(path) as zf:
+            # the member keeps the archive's file handle open after this closes
+            return zf.open(member)
+
+    def mmap(
+        self,
+        filename: str,
+        member: str | None = None,
+        version: str | None = None,
+        cache: Cache | None = None,
+    ) -> memoryview:
+        """
+        Read-only memory map of one verified cached file (fetched first if
+        needed), so large files are paged in on demand instead of copied.
+
+        With `member`, map that file inside the ZIP archive: a stored
+        (uncompressed) member is a view straight into the mapped archive, a
+        compressed one is inflated once into anonymous memory.
+        """
+        path = self._cached_file(filename, version, cache)
+        with path.open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap cannot map an empty file
+            view = (
+                memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                if size
+                else memoryview(b"")
+            )
+        if member is None:
+            return view
+
+        with zipfile.ZipFile(path) as zf:
+            info = zf.getinfo(member)
+            if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+                # data follows the local header, whose name and extra field
+                # lengths may differ from the central directory's
+                off = info.header_offset
+                name_len, extra_len = struct.unpack("<HH", view[off + 26 : off + 30])
+                start = off + 30 + name_len + extra_len
+                return view[start : start + info.file_size]
+            view.release()
+            if not info.file_size:
+                return memoryview(b"")
+            buf = mmap.mmap(-1, info.file_size)
+            with zf.open(info) as src:
+                done = 0
+                while done < info.file_size:
+                    n = src.readinto(memoryview(buf)[done:])
+                    if not n:
+                        break
+                    done += n
+            return memoryview(buf).toreadonly()
+
+    def stream(
+        self,
+        filename: str,
+        version: str | None = None,
+        cache: Cache | None = None,
+        tee: bool = False,
+        read_ahead: int = 8 * 1024 * 1024,
+    ) -> BinaryIO:
+        """
+        Open one file for reading straight from its download URL, so
+        processing can start on the first bytes instead of after a full
+        download. Up to `read_ahead` bytes are fetched ahead of the reader.
+
+        The bytes are checked against the registry checksum as they arrive;
+        a mismatch raises ChecksumError when the end is read. With `tee` they
+        are also stored in the cache, as fetch() would, once verified. A file
+        that is already cached is read from the cache instead.
+        """
+        cfg = load_config()
+        cache = cache or Cache.from_config(cfg)
+        v, job = self._job_for(filename, version, cache)
+        url, dest, checksum = job
+        cached = cache.object_path(checksum) if checksum else dest
+        if cached.exists():
+            return self.open(filename, version=version, cache=cache)
+        raw = cache.stream(
+            url,
+            dest,
+            checksum=checksum,
+            tee=tee,
+            read_ahead=read_ahead,
+            on_complete=lambda: self._finish_fetch(cache, v, [job]),
+        )
+        return io.BufferedReader(raw)
+
+    def _cached_file(
+        self, filename: str, version: str | None, cache: Cache | None
+    ) -> Path:
+        # fetch and verify just `filename` of the version, not all its files
+        cfg = load_config()
+        cache = cache or Cache.from_config(cfg)
+        v, job = self._job_for(filename, version, cache)
+        url, dest, checksum = job
+        cache.fetch_file(url, dest, checksum=checksum)
+        self._finish_fetch(cache, v, [job])
+        return dest
+
+    def _job_for(
+        self, filename: str, version: str | None, cache: Cache
+    ) -> tuple[dict, tuple[str, Path, str | None]]:
+        v, jobs = self._plan_fetch(version, cache)
+        for job in jobs:
+            if job[1].name == filename:
+                return v, job
+        raise RegistryError(
+            f"File {filename} not found in {self.dataset_id} "
+            f"version {v.get('version', 'unknown')}"
+        )
+
+    def _plan_fetch(
+        self, version: str | None, cache: Cache
+    ) -> tuple[dict, list[tuple[str, Path, str | None]]]:
+        # the version entry and one (url, view path, checksum) job per file
+        v = self._resolve_version(version)
+
+        jobs = []
         for f in v.get("files", []):
             name = f["name"]
-            checksum = f.get("checksum")
             url = f.get("download_url") or f.get("links", {}).get("self")
             if not url:
                 # registry can store download URL; otherwise you can resolve via records API
                 raise RegistryError(
                     f"Missing download URL for file {name} in {self.dataset_id}"
                 )
-
             dest = cache.path_for(self.dataset_id, name, v.get("version", "unknown"))
-            if not dest.exists():
-                cache.download(url, dest)
-            if checksum:
-                cache.verify_checksum(dest, checksum)
-            out.append(dest)
+            jobs.append((url, dest, f.get("checksum")))
+        return v, jobs
 
-        return out
+    def _finish_fetch(
+        self, cache: Cache, v: dict, jobs: list[tuple[str, Path, str | None]]
+    ) -> None:
+        vname = v.get("version", "unknown")
+        cache.record_access(
+            self.dataset_id, vname, [(dest, checksum) for _, dest, checksum in jobs]
+        )
+        if cache.max_bytes is not None:
+            cache.gc(keep=[(self.dataset_id, vname)])
@@ -0,0 +1,178 @@
+from __future__ import annotations
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import threading
+import time
+import warnings
+
+try:
+    import requests
+except ImportError as exc:  # registry-only install
+    raise ImportError(
+        "Downloading from and publishing to Zenodo needs requests; "
+        "install cogs-archive[zenodo]"
+    ) from exc
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .config import load_config
+
+_default_session: requests.Session | None = None
+_default_lock = threading.Lock()
+
+
+def make_session(
+    pool_size: int = 10, retries: int = 3, backoff_s: float = 0.5
+) -> requests.Session:
+    """
+    A keep-alive session whose connection pool holds `pool_size` connections
+    per host, enough for that many concurrent transfers to reuse TCP/TLS
+    connections instead of opening one per request.
+
+    Connection errors and 5xx responses are retried for GET/HEAD only; uploads
+    carry a body stream that cannot be replayed here, so ZenodoClient retries
+    those itself. 429s are left to the caller's RateLimiter.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_s,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        raise_on_status=False,
+        respect_retry_after_header=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def default_session() -> requests.Session:
+    """Process-wide session shared by caches that were not given their own."""
+    global _default_session
+    with _default_lock:
+        if _default_session is None:
+            _default_session = make_session()
+        return _default_session
+
+
+class RateLimiter:
+    """
+    Token bucket pacing API requests from every thread that shares it:
+    `per_minute` sustained with bursts of up to `burst`.
+
+    observe() feeds each response back. A 429's Retry-After, or an exhausted
+    X-RateLimit-Remaining with its X-RateLimit-Reset, pauses every caller until
+    the server's window reopens rather than letting threads keep hammering it.
+    """
+
+    def __init__(self, per_minute: float = 100, burst: int = 10):
+        if per_minute <= 0 or burst < 1:
+            raise ValueError("per_minute must be positive and burst at least 1")
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    float(self.burst), self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for `seconds` from now."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def observe(self, response: requests.Response) -> float | None:
+        """
+        Apply a response's rate-limit headers; returns the pause imposed, or
+        None if the headers did not call for one.
+        """
+        h = response.headers
+        delay = None
+        if response.status_code == 429:
+            delay = _retry_after(h.get("Retry-After"))
+        remaining = h.get("X-RateLimit-Remaining", "")
+        if delay is None and remaining.isdigit():
+            with self._lock:
+                # the server's count also covers other processes on this token
+                self._tokens = min(self._tokens, float(remaining))
+            reset = h.get("X-RateLimit-Reset", "")
+            if (int(remaining) == 0 or response.status_code == 429) and reset.isdigit():
+                delay = max(0.0, int(reset) - time.time())
+        if delay is not None:
+            self.pause(delay)
+        return delay
+
+
+def _retry_after(value: str | None) -> float | None:
+    # Retry-After is either delta-seconds or an HTTP date
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_limiters: dict[tuple[str, str], RateLimiter] = {}
+
+
+def shared_rate_limiter(
+    base_url: str, access_token: str, per_minute: float = 100
+) -> RateLimiter:
+    """
+    The process-wide limiter for one API token, as Zenodo limits per token.
+
+    The first call for a token sets its budget. A later call with a different
+    `per_minute` gets the same limiter and a RuntimeWarning, because two
+    budgets for one token would together overrun the server's limit; give a
+    client its own RateLimiter to pace it separately.
+    """
+    with _default_lock:
+        limiter = _limiters.get((base_url, access_token))
+        if limiter is None:
+            limiter = _limiters[(base_url, access_token)] = RateLimiter(
+                per_minute=per_minute
+            )
+    if limiter.rate != per_minute / 60.0:
+        warnings.warn(
+            f"requests_per_min={per_minute:g} ignored: this token's requests to "
+            f"{base_url} are already paced at {limiter.rate * 60:g} per minute",
+            RuntimeWarning,
+            stacklevel=2,
+        )
+    return limiter
+
+
+def download_rate_limiter(url: str) -> RateLimiter:
+    """
+    The process-wide limiter for file downloads from `url`'s host. Downloads
+    carry no token, so they share one budget per host, set by
+    LABARCHIVE_ZENODO_REQUESTS_PER_MIN.
+    """
+    parts = urlsplit(url)
+    return shared_rate_limiter(
+        f"{parts.scheme}://{parts.netloc}", "", load_config().zenodo_requests_per_min
+    )
@@ -0,0 +1,128 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+# flock() excludes other processes; these exclude other threads of this one,
+# which on NFS share a single POSIX lock owner. Each entry counts the threads
+# holding or waiting for it and is dropped when that reaches zero.
+_thread_locks: dict[str, tuple[threading.Lock, list[int]]] = {}
+_thread_locks_guard = threading.Lock()
+_held = threading.local()
+
+
+@contextmanager
+def _thread_lock(key: str) -> Iterator[threading.Lock]:
+    with _thread_locks_guard:
+        lock, users = _thread_locks.setdefault(key, (threading.Lock(), [0]))
+        users[0] += 1
+    try:
+        yield lock
+    finally:
+        with _thread_locks_guard:
+            users[0] -= 1
+            if not users[0]:
+                del _thread_locks[key]
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """
+    Hold an exclusive advisory lock on `path` (created if missing) across
+    threads and processes. Re-entrant within one thread, so a locked
+    transaction can call helpers that take the same lock.
+
+    The holder may delete `path` before releasing it; anyone who was waiting
+    then locks the file created in its place.
+    """
+    with _locked(path, blocking=True):
+        yield
+
+
+@contextmanager
+def try_file_lock(path: Path) -> Iterator[bool]:
+    """
+    file_lock() that does not wait: yields True holding the lock, or False
+    straight away if another thread or process holds it.
+    """
+    with _locked(path, blocking=False) as acquired:
+        yield acquired
+
+
+@contextmanager
+def _locked(path: Path, blocking: bool) -> Iterator[bool]:
+    key = os.path.abspath(path)
+    held = getattr(_held, "keys", None)
+    if held is None:
+        held = _held.keys = set()
+    if key in held:
+        yield True
+        return
+
+    with _thread_lock(key) as thread_lock:
+        if not thread_lock.acquire(blocking):
+            yield False
+            return
+        try:
+            while True:
+                fd = os.open(key, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    if not _lock_fd(fd, blocking):
+                        yield False
+                        return
+                    if not _is_current(fd, key):
+                        # deleted by its previous holder while we waited
+                        _unlock_fd(fd)
+                        continue
+                    held.add(key)
+                    try:
+                        yield True
+                    finally:
+                        held.discard(key)
+                        _unlock_fd(fd)
+                    return
+                finally:
+                    os.close(fd)
+        finally:
+            thread_lock.release()
+
+
+def _is_current(fd: int, path: str) -> bool:
+    # True if `fd` is still the file at `path`
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    fst = os.fstat(fd)
+    return (st.st_dev, st.st_ino) == (fst.st_dev, fst.st_ino)
+
+
+def _unlock_fd(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:  # pragma: no cover - Windows
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+def _lock_fd(fd: int, blocking: bool) -> bool:
+    # False if non-blocking and another process holds the lock
+    try:
+        if fcntl is not None:
+            fcntl.flock(
+                fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            )
+        else:  # pragma: no cover - Windows
+            msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+    except OSError:
+        if blocking:
+            raise
+        return False
+    return True
@@ -0,0 +1,146 @@
+from __future__ import annotations
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Iterator
+import threading
+import time
+
+# the installed receiver; None (the default) disables instrumentation, leaving
+# one global read per call site
+_active: Instrumentation | None = None
+_NULL_SPAN = nullcontext()
+
+
+class Instrumentation:
+    """
+    Receiver for the timing spans and counters emitted by ZenodoClient, Cache
+    and DatasetRegistry. Override span() and/or count(); the base class
+    ignores everything.
+
+    Spans: zenodo.request, cache.download, cache.hash (re-verifying a cached
+    file), registry.parse, registry.replay (journal) and registry.write.
+    Counters: zenodo.requests, zenodo.retries, zenodo.bytes_sent, cache.hits,
+    cache.misses, cache.bytes_received, cache.retries, cache.hash_seconds and
+    cache.write_seconds (time spent hashing and writing while downloading),
+    and registry.cache_hits (reads served without re-parsing).
+    """
+
+    def span(self, name: str, attrs: dict[str, Any]) -> ContextManager:
+        return _NULL_SPAN
+
+    def count(self, name: str, value: float, attrs: dict[str, Any]) -> None:
+        pass
+
+
+class CallbackInstrumentation(Instrumentation):
+    """
+    Forwards to plain callables: on_span(name, seconds, attrs) when a span
+    ends and on_count(name, value, attrs) per counter increment. They may be
+    called from worker threads.
+    """
+
+    def __init__(
+        self,
+        on_span: Callable[[str, float, dict], None] | None = None,
+        on_count: Callable[[str, float, dict], None] | None = None,
+    ):
+        self._on_span = on_span
+        self._on_count = on_count
+
+    def span(self, name: str, attrs: dict[str, Any]) -> ContextManager:
+        if self._on_span is None:
+            return _NULL_SPAN
+        return _timed(lambda seconds: self._on_span(name, seconds, attrs))
+
+    def count(self, name: str, value: float, attrs: dict[str, Any]) -> None:
+        if self._on_count is not None:
+            self._on_count(name, value, attrs)
+
+
+class Recorder(Instrumentation):
+    """
+    Keeps totals in memory: `counters[name]` summed over all attributes and
+    `spans[name]` as a list of durations in seconds.
+    """
+
+    def __init__(self):
+        self.counters: dict[str, float] = {}
+        self.spans: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def span(self, name: str, attrs: dict[str, Any]) -> ContextManager:
+        def record(seconds: float) -> None:
+            with self._lock:
+                self.spans.setdefault(name, []).append(seconds)
+
+        return _timed(record)
+
+    def count(self, name: str, value: float, attrs: dict[str, Any]) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+class OpenTelemetryInstrumentation(Instrumentation):
+    """
+    Adapter for an OpenTelemetry `tracer` and `meter` (from
+    opentelemetry.trace.get_tracer / metrics.get_meter). Spans become trace
+    spans and counters become OTel counters with the same attributes.
+    """
+
+    def __init__(self, tracer: Any, meter: Any):
+        self._tracer = tracer
+        self._meter = meter
+        self._counters: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def span(self, name: str, attrs: dict[str, Any]) -> ContextManager:
+        return self._tracer.start_as_current_span(name, attributes=attrs)
+
+    def count(self, name: str, value: float, attrs: dict[str, Any]) -> None:
+        with self._lock:
+            counter = self._counters.get(name)
+            if counter is None:
+                counter = self._counters[name] = self._meter.create_counter(name)
+        counter.add(value, attributes=attrs)
+
+
+def install(instrumentation: Instrumentation | None) -> None:
+    """Send spans and counters from this process to `instrumentation`."""
+    global _active
+    _active = instrumentation
+
+
+@contextmanager
+def instrumented(instrumentation: Instrumentation) -> Iterator[Instrumentation]:
+    """install() for the duration of a block, restoring the previous one."""
+    previous = _active
+    install(instrumentation)
+    try:
+        yield instrumentation
+    finally:
+        install(previous)
+
+
+def enabled() -> bool:
+    return _active is not None
+
+
+def span(name: str, **attrs: Any) -> ContextManager:
+    inst = _active
+    if inst is None:
+        return _NULL_SPAN
+    return inst.span(name, attrs)
+
+
+def count(name: str, value: float = 1, **attrs: Any) -> None:
+    inst = _active
+    if inst is not None:
+        inst.count(name, value, attrs)
+
+
+@contextmanager
+def _timed(done: Callable[[float], None]) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        done(time.perf_counter() - t0)
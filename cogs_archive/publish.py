@@ -1,38 +1,286 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import List, Union
+import hashlib
+import os
+import struct
+import time
+import zlib
 
 from .config import load_config
-from .zenodo import ZenodoClient
+from .publish_state import PublishState, file_checksum
+from .zenodo import UploadProgress, ZenodoClient
 from .registry import DatasetRegistry
-from .exceptions import ZenodoError
+from .exceptions import RegistryError, ZenodoError
+
+
+@dataclass(frozen=True)
+class PackagedFile:
+    """An archive built by package_directory(), with its local digests."""
+
+    path: Path
+    size: int
+    # "md5:<hex>", the form Zenodo reports, and "sha256:<hex>"
+    md5: str
+    sha256: str
+
+
+# a publish() input: a file, a directory to package, or a packaged archive
+PublishFile = Union[Path, PackagedFile]
+
+# deflate block handed to one compression thread
+_BLOCK = 4 * 1024 * 1024
+# deflate window; each block is primed with the tail of the one before
+_WINDOW = 32 * 1024
+# sizes and offsets from this value on need ZIP64 fields
+_ZIP64_LIMIT = 0xFFFFFFFF
+# what a 32-bit field holds when the real value is in the ZIP64 extra field
+_ZIP64_MARK = 0xFFFFFFFF
+
+
+def package_directory(
+    directory: Path,
+    dest: Path | None = None,
+    compress: bool = True,
+    workers: int | None = None,
+    level: int = 6,
+) -> PackagedFile:
+    """
+    Zip `directory` (as a top-level folder of that name) into `dest`, by
+    default `<directory>.zip` beside it, reading each file once.
+
+    Files are deflated in blocks by up to `workers` threads (default: one per
+    CPU); pass compress=False to store members as they are, e.g. for data that
+    is already compressed. The archive is hashed with md5 and sha256 while it
+    is written, so it is never read back. Members are added in sorted order
+    with their mtimes, so an unchanged directory packs to an identical archive.
+    """
+    directory = Path(directory)
+    if dest is None:
+        dest = directory.with_name(directory.name + ".zip")
+    dest = Path(dest)
+    part = dest.with_name(dest.name + ".part")
+    skip = {dest.resolve(), part.resolve()}
+    members = sorted(
+        (fp.relative_to(directory).as_posix(), fp)
+        for fp in directory.rglob("*")
+        if fp.is_file() and fp.resolve() not in skip
+    )
+    workers = workers or os.cpu_count() or 1
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with part.open("wb") as f, ThreadPoolExecutor(max_workers=workers) as pool:
+            out = _ZipWriter(f, pool, compress, level, max_pending=2 * workers)
+            for name, fp in members:
+                out.add(f"{directory.name}/{name}", fp)
+            out.close()
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(part, dest)
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+    return PackagedFile(
+        dest,
+        out.offset,
+        f"md5:{out.md5.hexdigest()}",
+        f"sha256:{out.sha256.hexdigest()}",
+    )
 
 
 def publish(
     dataset_id: str,
-    files: List[Path],
+    files: List[PublishFile],
     metadata: dict,
     version: str,
     registry_path: Path | None = None,
+    workers: int | None = None,
+    progress: UploadProgress | None = None,
 ) -> dict:
     """
     Publish a dataset release to Zenodo and update the lab registry.
 
     `metadata` should be Zenodo deposition metadata shaped like Zenodo's "metadata" dict:
     e.g. title, upload_type="dataset", creators, description, license, keywords, etc.
+
+    Files are uploaded concurrently by up to `workers` threads (default
+    `Config.upload_workers`); `progress(filename, bytes_sent, total)` is called
+    from those threads.
+
+    A directory in `files` is zipped first with package_directory() (pass a
+    PackagedFile to choose its options). Its md5 is checked against the
+    checksum Zenodo reports for the upload, and its sha256 is recorded in the
+    registry next to that checksum.
+
+    Progress is saved under `<cache_dir>/publish-state/` as it is made. If a
+    run dies part-way, calling publish() again for the same dataset and
+    version reuses the draft deposition, skips files already in its bucket
+    with a matching checksum, and does not publish twice.
+    """
+    cfg = load_config()
+    if not cfg.zenodo_access_token:
+        raise RuntimeError("ZENODO_ACCESS_TOKEN (or ZENODO_SANDBOX_TOKEN) is not set")
+
+    workers = workers or cfg.upload_workers
+    # one pooled session for every call of this publish, sized for the uploads
+    client = ZenodoClient(
+        access_token=cfg.zenodo_access_token,
+        base_url=cfg.zenodo_base_url,
+        requests_per_min=cfg.zenodo_requests_per_min,
+        pool_size=max(10, workers),
+    )
+    reg = DatasetRegistry(
+        path=registry_path or cfg.registry_path, journal=cfg.registry_journal
+    )
+
+    state = PublishState.open(cfg.cache_dir / "publish-state", dataset_id, version)
+    packages = _package_dir(cfg.cache_dir, dataset_id, version)
+    result, update = _publish_one(
+        client,
+        dataset_id,
+        files,
+        metadata,
+        version,
+        workers,
+        progress,
+        state,
+        _previous_version(reg, dataset_id),
+        packages,
+    )
+    reg.upsert_version(dataset_id, update)
+    state.clear()
+    _remove_packages(packages)
+    return result
+
+
+@dataclass(frozen=True)
+class PublishItem:
+    """One dataset release in a publish_many() manifest."""
+
+    dataset_id: str
+    version: str
+    files: List[PublishFile]
+    metadata: dict
+
+
+@dataclass(frozen=True)
+class PublishOutcome:
+    item: PublishItem
+    # publish()'s return value on success
+    result: dict | None = None
+    error: Exception | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def publish_many(
+    items: List[PublishItem],
+    registry_path: Path | None = None,
+    workers: int = 4,
+    upload_workers: int | None = None,
+    progress: UploadProgress | None = None,
+) -> List[PublishOutcome]:
+    """
+    Publish several dataset releases in one run, up to `workers` depositions
+    at a time, each uploading its files with `upload_workers` threads (default
+    `Config.upload_workers`). All depositions share one pooled client, and
+    the registry is updated for every successful item in a single write.
+
+    A failing item does not stop the others; outcomes are returned in the
+    order of `items` with either `result` or `error` set. Each item saves its
+    progress like publish() does, so rerunning the manifest resumes failed
+    items. A dataset may appear only once per run, since its items would
+    share one new-version draft; publish successive versions in separate
+    runs.
     """
+    seen: set[str] = set()
+    for item in items:
+        if item.dataset_id in seen:
+            raise ValueError(f"Dataset {item.dataset_id} appears more than once")
+        seen.add(item.dataset_id)
+
     cfg = load_config()
     if not cfg.zenodo_access_token:
         raise RuntimeError("ZENODO_ACCESS_TOKEN (or ZENODO_SANDBOX_TOKEN) is not set")
 
+    upload_workers = upload_workers or cfg.upload_workers
+    workers = max(1, min(workers, len(items) or 1))
     client = ZenodoClient(
-        access_token=cfg.zenodo_access_token, base_url=cfg.zenodo_base_url
+        access_token=cfg.zenodo_access_token,
+        base_url=cfg.zenodo_base_url,
+        requests_per_min=cfg.zenodo_requests_per_min,
+        pool_size=max(10, workers * upload_workers),
     )
-    reg = DatasetRegistry(path=registry_path or cfg.registry_path)
+    reg = DatasetRegistry(
+        path=registry_path or cfg.registry_path, journal=cfg.registry_journal
+    )
+
+    state_dir = cfg.cache_dir / "publish-state"
+
+    def run(item: PublishItem) -> tuple[PublishOutcome, dict | None]:
+        state = PublishState.open(state_dir, item.dataset_id, item.version)
+        try:
+            result, update = _publish_one(
+                client,
+                item.dataset_id,
+                item.files,
+                item.metadata,
+                item.version,
+                upload_workers,
+                progress,
+                state,
+                _previous_version(reg, item.dataset_id),
+                _package_dir(cfg.cache_dir, item.dataset_id, item.version),
+            )
+        except Exception as exc:
+            return PublishOutcome(item, error=exc), None
+        return PublishOutcome(item, result=result), update
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        done = list(pool.map(run, items))
+
+    updates = [
+        (outcome.item.dataset_id, update)
+        for outcome, update in done
+        if update is not None
+    ]
+    if updates:
+        reg.upsert_many(updates)
+        for outcome, update in done:
+            if update is not None:
+                PublishState.open(
+                    state_dir, outcome.item.dataset_id, outcome.item.version
+                ).clear()
+                _remove_packages(
+                    _package_dir(
+                        cfg.cache_dir, outcome.item.dataset_id, outcome.item.version
+                    )
+                )
+    return [outcome for outcome, _ in done]
 
-    # create a new deposition (draft)
-    dep = client.create_deposition()
-    dep_id = dep["id"]
 
+def _publish_one(
+    client: ZenodoClient,
+    dataset_id: str,
+    files: List[PublishFile],
+    metadata: dict,
+    version: str,
+    workers: int,
+    progress: UploadProgress | None,
+    state: PublishState,
+    previous: dict | None = None,
+    package_dir: Path | None = None,
+) -> tuple[dict, dict]:
+    """
+    Deposit and publish one release, resuming from `state`; returns (result,
+    registry update). `previous` is the latest registered version, if any;
+    directories in `files` are packaged into `package_dir`.
+    """
     # ensure required Zenodo fields are present and enforce COGS community
     md = dict(metadata)
     md.setdefault("upload_type", "dataset")
@@ -44,16 +292,71 @@ def publish(
             "All datasets must be published to the Zenodo community 'COGS'."
         )
 
-    # push metadata to deposition
-    client.update_metadata(dep_id, md)
+    # the names files are uploaded under; directories become <name>.zip
+    local_names = [_upload_name(f) for f in files]
+    packaged: dict[str, PackagedFile] = {}
+
+    published = state.published
+    if published is None:
+        handle = state.deposition
+        if handle is None:
+            # create a new deposition (draft), or a new-version draft holding
+            # the previous version's files; either response carries the
+            # bucket link, so the handle saves a lookup per file
+            if previous and previous.get("recid"):
+                current = client.new_version(previous["recid"])
+            else:
+                current = client.create_deposition()
+            handle = client.open_deposition(current)
+            state.set_deposition(handle)
+        else:
+            # resuming: the draft may have been published just before a crash
+            current = client.get_deposition(handle.id)
+            if current.get("submitted"):
+                published = current
 
-    # upload files
-    uploaded = []
-    for fp in files:
-        uploaded.append(client.upload_file(dep_id, fp))
+    if published is None:
+        # package directories only while there is still something to upload
+        files, packaged = _packaged_inputs(files, package_dir)
+        if packaged:
+            state.record_packaged({n: pkg.sha256 for n, pkg in packaged.items()})
 
-    # publish deposition
-    published = client.publish(dep_id)
+        # push metadata to deposition
+        client.update_metadata(handle.id, md)
+
+        # keep files identical to the previous version or already uploaded by
+        # an earlier run; drop every other file the draft carried forward
+        unchanged = _unchanged_files(files, previous, workers, packaged)
+        keep = {
+            fp.name for fp in files if fp.name in unchanged or state.is_uploaded(fp)
+        }
+        for f in current.get("files") or []:
+            if f.get("filename") not in keep:
+                client.delete_file(handle.id, f["id"])
+        pending = [fp for fp in files if fp.name not in keep]
+
+        def on_done(fp: Path, response: dict) -> None:
+            pkg = packaged.get(fp.name)
+            reported = _as_md5(response.get("checksum"))
+            if pkg is not None and reported and reported != pkg.md5:
+                raise ZenodoError(
+                    f"Checksum mismatch for uploaded {fp.name}: "
+                    f"packaged {pkg.md5}, Zenodo reports {reported}"
+                )
+            state.record_upload(fp, response)
+
+        client.upload_files(
+            handle,
+            pending,
+            workers=workers,
+            progress=progress,
+            on_done=on_done,
+        )
+
+        # publish deposition
+        published = client.publish(handle.id)
+    if state.published is None:
+        state.set_published(published)
 
     # Pull identifiers from publish response (Zenodo may use "id" or "record_id")
     conceptrecid = published.get("conceptrecid")
@@ -64,17 +367,23 @@ def publish(
     # File info: use local filenames as the source of truth.
     # Zenodo's publish response may not reliably include "filename" immediately.
     files_entry = []
-    local_names = [fp.name for fp in files]
-    for local_name, f in zip(local_names, published.get("files", [])):
+    sha256 = state.packaged
+    published_files = published.get("files", [])
+    by_name = {f.get("filename") or f.get("key"): f for f in published_files}
+    if all(name in by_name for name in local_names):
+        # carried-forward files need not come back in upload order
+        published_files = [by_name[name] for name in local_names]
+    for local_name, f in zip(local_names, published_files):
         links = f.get("links", {}) or {}
-        files_entry.append(
-            {
-                "name": local_name,
-                "checksum": f.get("checksum"),
-                "size": f.get("filesize") or f.get("size"),
-                "download_url": links.get("download") or links.get("self"),
-            }
-        )
+        entry = {
+            "name": local_name,
+            "checksum": f.get("checksum"),
+            "size": f.get("filesize") or f.get("size"),
+            "download_url": links.get("download") or links.get("self"),
+        }
+        if local_name in sha256:
+            entry["sha256"] = sha256[local_name]
+        files_entry.append(entry)
 
     # update registry entry (append version)
     update = {
@@ -99,11 +408,320 @@ def publish(
         "license": md.get("license"),
     }
 
-    reg.upsert_version(dataset_id, update)
-
-    return {
+    result = {
         "dataset_id": dataset_id,
         "doi": doi,
         "conceptdoi": conceptdoi,
         "recid": recid,
     }
+    return result, update
+
+
+def _previous_version(reg: DatasetRegistry, dataset_id: str) -> dict | None:
+    try:
+        return reg.get(dataset_id).latest()
+    except RegistryError:
+        return None
+
+
+def _unchanged_files(
+    files: List[Path],
+    previous: dict | None,
+    workers: int,
+    packaged: dict[str, PackagedFile] | None = None,
+) -> set[str]:
+    """Names of local files byte-identical (by md5) to `previous`'s."""
+    if not previous:
+        return set()
+    known = {
+        f.get("name"): _as_md5(f.get("checksum")) for f in previous.get("files") or []
+    }
+    packaged = packaged or {}
+    candidates = [fp for fp in files if known.get(fp.name)]
+    # packaged archives were hashed as they were written
+    to_hash = [fp for fp in candidates if fp.name not in packaged]
+    digests = {fp.name: pkg.md5 for fp in candidates if (pkg := packaged.get(fp.name))}
+    if to_hash:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(to_hash)))) as pool:
+            digests.update(
+                zip((fp.name for fp in to_hash), pool.map(file_checksum, to_hash))
+            )
+    return {name for name, digest in digests.items() if digest == known[name]}
+
+
+def _as_md5(checksum: str | None) -> str | None:
+    # Zenodo's deposit API reports bare md5 hex digests; the registry "md5:<hex>"
+    if not checksum:
+        return None
+    if ":" not in checksum:
+        return f"md5:{checksum}"
+    return checksum if checksum.startswith("md5:") else None
+
+
+def _package_dir(cache_dir: Path, dataset_id: str, version: str) -> Path:
+    safe = dataset_id.replace(":", "_").replace("/", "_")
+    return Path(cache_dir) / "packages" / f"{safe}-{version}"
+
+
+def _upload_name(f: PublishFile) -> str:
+    # what a publish() input is uploaded as, without packaging it
+    if isinstance(f, PackagedFile):
+        return f.path.name
+    f = Path(f)
+    return f"{f.name}.zip" if f.is_dir() else f.name
+
+
+def _packaged_inputs(
+    files: List[PublishFile], package_dir: Path | None
+) -> tuple[List[Path], dict[str, PackagedFile]]:
+    # the paths to upload, and the packaged archives among them by name
+    paths, packaged = [], {}
+    for f in files:
+        if not isinstance(f, PackagedFile) and Path(f).is_dir():
+            if package_dir is None:
+                raise ValueError(f"Cannot package directory {f} here; zip it first")
+            f = package_directory(Path(f), package_dir / _upload_name(f))
+        if isinstance(f, PackagedFile):
+            packaged[f.path.name] = f
+            f = f.path
+        paths.append(Path(f))
+    return paths, packaged
+
+
+def _remove_packages(package_dir: Path) -> None:
+    # archives built for a release, once it is in the registry
+    if package_dir.is_dir():
+        for fp in package_dir.iterdir():
+            fp.unlink(missing_ok=True)
+        package_dir.rmdir()
+
+
+class _ZipEntry:
+    # one archive member; sizes are filled in as its data is written
+    __slots__ = (
+        "name",
+        "method",
+        "mtime",
+        "mode",
+        "zip64",
+        "crc",
+        "size",
+        "csize",
+        "offset",
+    )
+
+    def __init__(self, name: bytes, method: int, mtime: tuple, mode: int, zip64: bool):
+        self.name = name
+        self.method = method
+        self.mtime = mtime
+        self.mode = mode
+        self.zip64 = zip64
+        self.crc = 0
+        self.size = 0
+        self.csize = 0
+        self.offset = 0
+
+
+class _ZipWriter:
+    """
+    Streams a ZIP archive to `f` in a single pass, with block-parallel deflate
+    and md5/sha256 of the output as it is written.
+
+    Each member's deflate stream is cut into blocks compressed independently
+    on `pool` (each primed with the previous block's last 32 KiB, as pigz
+    does) and joined with sync flushes. CRCs and sizes are not known until a
+    member is written, so they follow its data in a data descriptor rather
+    than being patched into the header, which would mean re-reading the
+    output to hash it. Writes happen in member order; up to `max_pending`
+    compressed blocks may be in flight.
+    """
+
+    def __init__(
+        self, f, pool: ThreadPoolExecutor, compress: bool, level: int, max_pending: int
+    ):
+        self.f = f
+        self.pool = pool
+        self.method = 8 if compress else 0  # deflated / stored
+        self.level = level
+        self.max_pending = max_pending
+        self.md5 = hashlib.md5()
+        self.sha256 = hashlib.sha256()
+        self.offset = 0
+        self.entries: list[_ZipEntry] = []
+        # (kind, entry, bytes | Future) in output order
+        self._queue: deque = deque()
+        self._in_flight = 0
+
+    def add(self, name: str, fp: Path) -> None:
+        st = fp.stat()
+        # leave room for deflate overhead when deciding on ZIP64 up front
+        zip64 = st.st_size + st.st_size // 64 + 4096 >= _ZIP64_LIMIT
+        mtime = time.localtime(st.st_mtime)[:6]
+        if mtime[0] < 1980:
+            mtime = (1980, 1, 1, 0, 0, 0)
+        e = _ZipEntry(name.encode("utf-8"), self.method, mtime, st.st_mode, zip64)
+        self.entries.append(e)
+        self._push("header", e, self._local_header(e))
+        with fp.open("rb") as src:
+            block = src.read(_BLOCK)
+            window = b""
+            while True:
+                following = src.read(_BLOCK) if len(block) == _BLOCK else b""
+                e.crc = zlib.crc32(block, e.crc)
+                e.size += len(block)
+                if self.method == 0:
+                    self._push("data", e, block)
+                else:
+                    self._push(
+                        "data",
+                        e,
+                        self.pool.submit(
+                            _deflate_block, block, window, not following, self.level
+                        ),
+                    )
+                if not following:
+                    break
+                window = block[-_WINDOW:]
+                block = following
+        self._push("descriptor", e, None)
+
+    def close(self) -> None:
+        self._drain(0)
+        cd_offset = self.offset
+        for e in self.entries:
+            self._write(self._central_header(e))
+        cd_size = self.offset - cd_offset
+        n = len(self.entries)
+        if n >= 0xFFFF or cd_offset >= _ZIP64_LIMIT or cd_size >= _ZIP64_LIMIT:
+            eocd64 = self.offset
+            record = struct.pack(
+                "<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, n, n, cd_size, cd_offset
+            )
+            self._write(record)
+            self._write(struct.pack("<IIQI", 0x07064B50, 0, eocd64, 1))
+        self._write(
+            struct.pack(
+                "<IHHHHIIH",
+                0x06054B50,
+                0,
+                0,
+                min(n, 0xFFFF),
+                min(n, 0xFFFF),
+                _field32(cd_size),
+                _field32(cd_offset),
+                0,
+            )
+        )
+
+    def _push(self, kind: str, e: _ZipEntry, payload) -> None:
+        self._queue.append((kind, e, payload))
+        if isinstance(payload, Future):
+            self._in_flight += 1
+        self._drain(self.max_pending)
+
+    def _drain(self, max_pending: int) -> None:
+        # write out everything that is ready, waiting on the oldest block
+        # while more than `max_pending` are still compressing
+        while self._queue:
+            kind, e, payload = self._queue[0]
+            if isinstance(payload, Future):
+                if self._in_flight <= max_pending and not payload.done():
+                    return
+                payload = payload.result()
+                self._in_flight -= 1
+            self._queue.popleft()
+            if kind == "header":
+                e.offset = self.offset
+            elif kind == "data":
+                e.csize += len(payload)
+            else:
+                payload = self._descriptor(e)
+            self._write(payload)
+
+    def _write(self, data: bytes) -> None:
+        self.f.write(data)
+        self.md5.update(data)
+        self.sha256.update(data)
+        self.offset += len(data)
+
+    def _flags(self, e: _ZipEntry) -> int:
+        # bit 3: sizes in a data descriptor; bit 11: UTF-8 names
+        return 0x08 | (0 if e.name.isascii() else 0x800)
+
+    def _dos_time(self, e: _ZipEntry) -> tuple[int, int]:
+        y, mo, d, h, mi, s = e.mtime
+        return (h << 11) | (mi << 5) | (s // 2), ((y - 1980) << 9) | (mo << 5) | d
+
+    def _local_header(self, e: _ZipEntry) -> bytes:
+        dos_time, dos_date = self._dos_time(e)
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0) if e.zip64 else b""
+        unknown = _ZIP64_MARK if e.zip64 else 0
+        return (
+            struct.pack(
+                "<IHHHHHIIIHH",
+                0x04034B50,
+                45 if e.zip64 else 20,
+                self._flags(e),
+                e.method,
+                dos_time,
+                dos_date,
+                0,
+                unknown,
+                unknown,
+                len(e.name),
+                len(extra),
+            )
+            + e.name
+            + extra
+        )
+
+    def _descriptor(self, e: _ZipEntry) -> bytes:
+        if e.zip64 or e.size >= _ZIP64_LIMIT or e.csize >= _ZIP64_LIMIT:
+            return struct.pack("<IIQQ", 0x08074B50, e.crc, e.csize, e.size)
+        return struct.pack("<IIII", 0x08074B50, e.crc, e.csize, e.size)
+
+    def _central_header(self, e: _ZipEntry) -> bytes:
+        # ZIP64 extra field values, in the order the format requires
+        wide = [v for v in (e.size, e.csize, e.offset) if v >= _ZIP64_LIMIT]
+        extra = b""
+        if wide:
+            extra = struct.pack(f"<HH{len(wide)}Q", 1, 8 * len(wide), *wide)
+        version = 45 if (wide or e.zip64) else 20
+        dos_time, dos_date = self._dos_time(e)
+        return (
+            struct.pack(
+                "<IHHHHHHIIIHHHHHII",
+                0x02014B50,
+                (3 << 8) | version,  # made by Unix, so external_attr is a mode
+                version,
+                self._flags(e),
+                e.method,
+                dos_time,
+                dos_date,
+                e.crc,
+                _field32(e.csize),
+                _field32(e.size),
+                len(e.name),
+                len(extra),
+                0,
+                0,
+                0,
+                (e.mode & 0xFFFF) << 16,
+                _field32(e.offset),
+            )
+            + e.name
+            + extra
+        )
+
+
+def _field32(value: int) -> int:
+    return _ZIP64_MARK if value >= _ZIP64_LIMIT else value
+
+
+def _deflate_block(block: bytes, window: bytes, last: bool, level: int) -> bytes:
+    # raw deflate of one block; zlib releases the GIL while compressing
+    if window:
+        c = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=window)
+    else:
+        c = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return c.compress(block) + c.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
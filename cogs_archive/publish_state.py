@@ -0,0 +1,117 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Any
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from .zenodo import Deposition
+
+
+class PublishState:
+    """
+    Progress of one publish() of a dataset version, kept in a small JSON file
+    so a rerun after a crash resumes instead of starting over.
+
+    Records the draft deposition, the files already uploaded to its bucket
+    (with the checksum Zenodo reported), the sha256 of archives packaged for
+    the run, and the publish response once publishing succeeded. Every change
+    is written through atomically; upload threads may record files
+    concurrently.
+    """
+
+    def __init__(self, path: Path, data: dict[str, Any]):
+        self.path = path
+        self._data = data
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, state_dir: Path, dataset_id: str, version: str) -> "PublishState":
+        safe = dataset_id.replace(":", "_").replace("/", "_")
+        path = Path(state_dir) / f"{safe}-{version}.json"
+        try:
+            data = json.loads(path.read_text())
+        except FileNotFoundError:
+            data = {"dataset_id": dataset_id, "version": version}
+        data.setdefault("uploaded", {})
+        return cls(path, data)
+
+    @property
+    def deposition(self) -> Deposition | None:
+        dep = self._data.get("deposition")
+        return Deposition.from_json(dep) if dep else None
+
+    def set_deposition(self, dep: Deposition) -> None:
+        with self._lock:
+            self._data["deposition"] = {"id": dep.id, "links": dep.links}
+            self._save()
+
+    def is_uploaded(self, file_path: Path) -> bool:
+        """
+        True if `file_path` went into the bucket on an earlier run and the
+        local file still matches the checksum Zenodo reported for it.
+        """
+        entry = self._data["uploaded"].get(file_path.name)
+        if not entry or not entry.get("checksum"):
+            return False
+        if entry.get("size") != os.path.getsize(file_path):
+            return False
+        algo = entry["checksum"].split(":", 1)[0]
+        return file_checksum(file_path, algo) == entry["checksum"]
+
+    def record_upload(self, file_path: Path, response: dict) -> None:
+        with self._lock:
+            self._data["uploaded"][file_path.name] = {
+                "checksum": response.get("checksum"),
+                "size": response.get("size"),
+            }
+            self._save()
+
+    @property
+    def packaged(self) -> dict[str, str]:
+        """sha256 ("sha256:<hex>") of each packaged archive, by file name."""
+        return dict(self._data.get("packaged") or {})
+
+    def record_packaged(self, sha256: dict[str, str]) -> None:
+        with self._lock:
+            self._data.setdefault("packaged", {}).update(sha256)
+            self._save()
+
+    @property
+    def published(self) -> dict | None:
+        return self._data.get("published")
+
+    def set_published(self, response: dict) -> None:
+        with self._lock:
+            self._data["published"] = response
+            self._save()
+
+    def clear(self) -> None:
+        """Forget the run once its result is in the registry."""
+        self.path.unlink(missing_ok=True)
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(
+            dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+
+def file_checksum(file_path: Path, algo: str = "md5") -> str:
+    """Digest of a local file in the registry's "algo:hex" form."""
+    h = hashlib.new(algo)
+    with file_path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return f"{algo}:{h.hexdigest()}"
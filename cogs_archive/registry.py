@@ -1,28 +1,167 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
+import copy
+import json
+import os
 import yaml
 import tempfile
 import sys
-from typing import Any
+import threading
+from typing import TYPE_CHECKING, Any, Iterator
 
+from . import metrics
+from .cache import BandwidthLimiter, Cache, shared_bandwidth_limiter
+from .config import load_config
 from .exceptions import RegistryError
 from .dataset import RegisteredDataset
+from .locking import file_lock
+
+if TYPE_CHECKING:
+    # imported in sync() only: lookups must not load the HTTP stack
+    from .zenodo import ZenodoClient
+
+# libyaml bindings parse/emit an order of magnitude faster when available
+try:
+    from yaml import CSafeDumper as _Dumper, CSafeLoader as _Loader
+except ImportError:  # pragma: no cover - PyYAML built without libyaml
+    from yaml import SafeDumper as _Dumper, SafeLoader as _Loader
+
+
+_StatKey = tuple[int, int, int]
+
+
+class _Snapshot:
+    """
+    Parsed registry file with its journal replayed, plus lookup tables, valid
+    for one pair of (file, journal) stat keys. `base` is the YAML document
+    alone, so a journal append does not force a YAML re-parse.
+    """
+
+    def __init__(
+        self,
+        key: tuple[_StatKey | None, _StatKey | None] | None,
+        data: dict[str, Any],
+        base: dict[str, Any] | None = None,
+    ):
+        self.key = key
+        self.data = data
+        self.base = data if base is None else base
+        self._by_doi: dict[str, str] | None = None
+
+    @property
+    def by_doi(self) -> dict[str, str]:
+        # built on first DOI lookup; maps concept and version DOIs to dataset IDs
+        if self._by_doi is None:
+            index = {}
+            for ds_id, ds in self.data["datasets"].items():
+                z = (ds or {}).get("zenodo") or {}
+                if z.get("conceptdoi"):
+                    index[z["conceptdoi"]] = ds_id
+                for v in z.get("versions") or []:
+                    if v.get("doi"):
+                        index[v["doi"]] = ds_id
+            self._by_doi = index
+        return self._by_doi
+
+
+@dataclass(frozen=True)
+class SyncReport:
+    # number of distinct records resolved
+    checked: int
+    # (dataset_id, version) pairs whose file entries changed
+    updated: list[tuple[str, str]] = field(default_factory=list)
+    # (recid, error) for records that could not be fetched
+    errors: list[tuple[int, Exception]] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class PrefetchReport:
+    # (dataset_id, version) -> cached paths, in registry order
+    fetched: dict[tuple[str, str], list[Path]] = field(default_factory=dict)
+    # (dataset_id, requested version, error) for versions not fully cached
+    errors: list[tuple[str, str | None, Exception]] = field(default_factory=list)
+
+
+# shared across DatasetRegistry instances pointing at the same file
+_snapshots: dict[str, _Snapshot] = {}
+_snapshots_lock = threading.Lock()
 
 
 @dataclass
 class DatasetRegistry:
     path: Path
 
-    def __init__(self, path: Path | str = "data-registry.yaml"):
+    def __init__(
+        self,
+        path: Path | str = "data-registry.yaml",
+        journal: bool = False,
+        compact_after: int | None = None,
+    ):
+        """
+        With `journal=True` upserts append a small record to a sidecar
+        `<path>.journal` instead of rewriting the whole YAML file, and
+        compact() folds the journal back in. Once the journal holds
+        `compact_after` records an upsert compacts it automatically.
+
+        Reads always merge the journal, whatever mode the reader is in, and any
+        full write (transaction(), upsert_many() without journaling, save())
+        folds it into the YAML file.
+        """
         self.path = Path(path)
+        self.journal = journal
+        self.compact_after = compact_after
+        # pending data while a transaction() is open
+        self._txn: dict[str, Any] | None = None
+        self._txn_owner: int | None = None
+        self._txn_lock = threading.Lock()
+
+    def _snapshot(self) -> _Snapshot:
+        """
+        The parsed registry, re-read only when the mtime, size or inode of the
+        file or its journal changed since the last parse. Treat the returned
+        data as read-only.
+        """
+        # journal before file: compaction rewrites the file and then drops the
+        # journal, so this order never misses records (replay skips repeats)
+        journal_key = _stat_key(_journal_path(self.path))
+        file_key = _stat_key(self.path)
+        if file_key is None and journal_key is None:
+            return _Snapshot(None, {"datasets": {}})
+        key = (file_key, journal_key)
+        cache_key = os.path.abspath(self.path)
+        with _snapshots_lock:
+            snap = _snapshots.get(cache_key)
+        if snap is not None and snap.key == key:
+            metrics.count("registry.cache_hits")
+            return snap
+
+        if snap is not None and snap.key is not None and snap.key[0] == file_key:
+            base = snap.base
+        elif file_key is None:
+            base = {"datasets": {}}
+        else:
+            with metrics.span("registry.parse", path=str(self.path)):
+                base = yaml.load(self.path.read_text(), Loader=_Loader) or {}
+            base.setdefault("datasets", {})
+        data = base
+        records = _read_journal(_journal_path(self.path)) if journal_key else []
+        if records:
+            with metrics.span("registry.replay", records=len(records)):
+                data = copy.deepcopy(base)
+                # records already folded in by a compaction that crashed
+                # before dropping the journal are skipped by _merge_version
+                for dataset_id, update in records:
+                    _merge_version(data, dataset_id, update)
+        snap = _Snapshot(key, data, base)
+        with _snapshots_lock:
+            _snapshots[cache_key] = snap
+        return snap
 
     def load(self) -> dict[str, Any]:
-        if not self.path.exists():
-            return {"datasets": {}}
-        data = yaml.safe_load(self.path.read_text()) or {}
-        data.setdefault("datasets", {})
-        return data
+        # a private copy: callers such as upsert_version mutate the result
+        return copy.deepcopy(self._snapshot().data)
 
     def save(self, data: dict[str, Any]) -> None:
         """
@@ -32,6 +171,12 @@ class DatasetRegistry:
         short warning. This makes tests and environments without write access
         to arbitrary root paths robust.
         """
+        out_path = self._out_path()
+        with file_lock(_lock_path(out_path)):
+            _atomic_write(out_path, data)
+            _journal_path(out_path).unlink(missing_ok=True)
+
+    def _out_path(self) -> Path:
         out_path = self.path
         parent = out_path.parent
         try:
@@ -60,41 +205,354 @@ class DatasetRegistry:
 
         # Ensure final parent exists (temp dir will exist)
         out_path.parent.mkdir(parents=True, exist_ok=True)
-        out_path.write_text(yaml.safe_dump(data, sort_keys=False, allow_unicode=True))
+        return out_path
 
     def list_ids(self) -> list[str]:
-        data = self.load()
+        data = self._snapshot().data
         return sorted(list(data["datasets"].keys()))
 
     def get(self, dataset_id: str) -> RegisteredDataset:
-        data = self.load()
+        data = self._snapshot().data
         ds = data["datasets"].get(dataset_id)
         if not ds:
             raise RegistryError(f"Dataset not found in registry: {dataset_id}")
-        return RegisteredDataset(dataset_id=dataset_id, spec=ds)
+        return RegisteredDataset(dataset_id=dataset_id, spec=copy.deepcopy(ds))
+
+    def get_by_doi(self, doi: str) -> RegisteredDataset:
+        """Look up a dataset by its concept DOI or any of its version DOIs."""
+        dataset_id = self._snapshot().by_doi.get(doi)
+        if dataset_id is None:
+            raise RegistryError(f"DOI not found in registry: {doi}")
+        return self.get(dataset_id)
 
     def upsert_version(self, dataset_id: str, dataset_spec_update: dict) -> None:
-        data = self.load()
-        data["datasets"].setdefault(dataset_id, {})
-        # shallow-merge for now
-        existing = data["datasets"][dataset_id]
-        # if there's an existing zenodo.versions, append new versions rather than overwrite
-        if (
-            "zenodo" in existing
-            and "versions" in existing["zenodo"]
-            and "zenodo" in dataset_spec_update
-            and "versions" in dataset_spec_update["zenodo"]
-        ):
-            # append versions
-            existing_versions = existing["zenodo"].get("versions", [])
-            new_versions = dataset_spec_update["zenodo"].get("versions", [])
-            existing["zenodo"]["versions"] = existing_versions + new_versions
-            # copy other zenodo keys
-            for k, v in dataset_spec_update["zenodo"].items():
-                if k != "versions":
-                    existing["zenodo"][k] = v
-        else:
-            # overwrite/merge top-level keys
-            existing.update(dataset_spec_update)
-        data["datasets"][dataset_id] = existing
-        self.save(data)
+        with self._txn_lock:
+            if self._txn is not None:
+                # batched into the open transaction's single write
+                _merge_version(self._txn, dataset_id, dataset_spec_update)
+                return
+        if self.journal:
+            self._append([(dataset_id, dataset_spec_update)])
+            return
+        with self.transaction() as data:
+            _merge_version(data, dataset_id, dataset_spec_update)
+
+    def upsert_many(self, updates: list[tuple[str, dict]]) -> None:
+        """
+        Apply several (dataset_id, update) pairs with a single rewrite of the
+        registry file, or a single journal append in journal mode.
+        """
+        if self.journal and self._txn_owner != threading.get_ident():
+            self._append(updates)
+            return
+        with self.transaction() as data:
+            for dataset_id, update in updates:
+                _merge_version(data, dataset_id, update)
+
+    def compact(self) -> None:
+        """Fold the journal into the registry file and remove it."""
+        with self.transaction():
+            pass
+
+    def _append(self, updates: list[tuple[str, dict]]) -> None:
+        out_path = self._out_path()
+        journal = _journal_path(out_path)
+        with file_lock(_lock_path(out_path)):
+            _append_journal(journal, updates)
+            if (
+                self.compact_after is not None
+                and journal.read_bytes().count(b"\n") >= self.compact_after
+            ):
+                self.compact()
+
+    def sync(self, client: ZenodoClient | None = None, workers: int = 8) -> SyncReport:
+        """
+        Refresh the size, checksum and download URL of every registered file
+        from its published Zenodo record.
+
+        Records are fetched concurrently by up to `workers` threads. The
+        default client keeps responses under `<cache_dir>/records/` and
+        revalidates them with ETags, so records that did not change cost a 304.
+        The registry is written once, and only if some entry changed.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from .zenodo import ZenodoClient
+
+        if client is None:
+            cfg = load_config()
+            client = ZenodoClient(
+                access_token=cfg.zenodo_access_token,
+                base_url=cfg.zenodo_base_url,
+                requests_per_min=cfg.zenodo_requests_per_min,
+                pool_size=max(10, workers),
+                record_cache_dir=cfg.cache_dir / "records",
+            )
+        data = self._snapshot().data
+        recids = sorted(
+            {
+                v["recid"]
+                for ds in data["datasets"].values()
+                for v in ((ds or {}).get("zenodo") or {}).get("versions") or []
+                if v.get("recid")
+            }
+        )
+
+        def fetch(recid: int) -> tuple[int, dict | None, Exception | None]:
+            try:
+                return recid, client.get_record(recid), None
+            except Exception as exc:
+                return recid, None, exc
+
+        n_workers = max(1, min(workers, len(recids) or 1))
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            fetched = list(pool.map(fetch, recids))
+        records = {recid: rec for recid, rec, _ in fetched if rec is not None}
+        errors = [(recid, exc) for recid, _, exc in fetched if exc is not None]
+
+        changes = {}
+        for ds_id, ds in data["datasets"].items():
+            for v in ((ds or {}).get("zenodo") or {}).get("versions") or []:
+                record = records.get(v.get("recid"))
+                if record is None:
+                    continue
+                files = _synced_files(v.get("files") or [], record)
+                if files != (v.get("files") or []):
+                    changes[(ds_id, v["recid"])] = (v.get("version"), files)
+
+        updated = []
+        if changes:
+            with self.transaction() as txn:
+                for ds_id, ds in txn["datasets"].items():
+                    for v in ((ds or {}).get("zenodo") or {}).get("versions") or []:
+                        change = changes.get((ds_id, v.get("recid")))
+                        if change is not None:
+                            v["files"] = change[1]
+                            updated.append((ds_id, change[0]))
+        return SyncReport(len(recids), updated, errors)
+
+    def prefetch(
+        self,
+        dataset_ids: list[str] | None = None,
+        versions: list[str | None] | None = None,
+        cache: Cache | None = None,
+        workers: int | None = None,
+        limiter: BandwidthLimiter | None = None,
+    ) -> PrefetchReport:
+        """
+        Warm the cache with dataset versions ahead of a job array, so that its
+        tasks' fetch() calls are cache hits. `versions` pairs up with
+        `dataset_ids` (default: every registered dataset); a missing list or a
+        None entry means the latest version.
+
+        Files are fetched by up to `workers` threads (default
+        `Config.fetch_workers`) across all the datasets, and content shared
+        between versions is downloaded once. Several nodes may prefetch into
+        the same shared cache directory at once. Failures are reported per
+        version rather than raised.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        cfg = load_config()
+        cache = cache or Cache.from_config(cfg)
+        workers = workers or cfg.fetch_workers
+        if limiter is None and cfg.max_bytes_per_s:
+            limiter = shared_bandwidth_limiter(cfg.max_bytes_per_s)
+        ids = self.list_ids() if dataset_ids is None else list(dataset_ids)
+        if versions is None:
+            versions = [None] * len(ids)
+        elif len(versions) != len(ids):
+            raise ValueError("versions must pair up with dataset_ids")
+
+        errors: list[tuple[str, str | None, Exception]] = []
+        planned = []
+        for ds_id, version in zip(ids, versions):
+            try:
+                ds = self.get(ds_id)
+                v, jobs = ds._plan_fetch(version, cache)
+            except RegistryError as exc:
+                errors.append((ds_id, version, exc))
+                continue
+            planned.append((ds, version, v, jobs))
+
+        def fetch_one(job: tuple[str, Path, str | None]) -> Path | Exception:
+            url, dest, checksum = job
+            try:
+                return cache.fetch_file(url, dest, checksum=checksum, limiter=limiter)
+            except Exception as exc:
+                return exc
+
+        all_jobs = [job for *_, jobs in planned for job in jobs]
+        n_workers = max(1, min(workers, len(all_jobs) or 1))
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            results = iter(list(pool.map(fetch_one, all_jobs)))
+
+        fetched = {}
+        for ds, version, v, jobs in planned:
+            out = [next(results) for _ in jobs]
+            failed = [r for r in out if isinstance(r, Exception)]
+            if failed:
+                errors.append((ds.dataset_id, version, failed[0]))
+                continue
+            key = (ds.dataset_id, v.get("version", "unknown"))
+            cache.record_access(*key, [(dest, checksum) for _, dest, checksum in jobs])
+            fetched[key] = out
+        if cache.max_bytes is not None:
+            # evict older versions, never the ones this job array is about to use
+            cache.gc(keep=list(fetched))
+        return PrefetchReport(fetched, errors)
+
+    @contextmanager
+    def transaction(self) -> Iterator[dict[str, Any]]:
+        """
+        Lock the registry, re-read it, and write it back once on exit.
+
+        Writers in other threads and processes are serialized on a sidecar
+        `.lock` file and each works on the latest registry, so concurrent
+        publishes cannot drop each other's versions; the file is replaced
+        atomically so a crash never leaves it truncated. upsert_version()
+        calls made on this registry object (from any thread) while the block
+        is open join the same write. Nothing is written if the block raises.
+        The write folds in and removes any journal.
+        """
+        if self._txn_owner == threading.get_ident():
+            yield self._txn
+            return
+        out_path = self._out_path()
+        with file_lock(_lock_path(out_path)):
+            data = self.load()
+            with self._txn_lock:
+                self._txn, self._txn_owner = data, threading.get_ident()
+            try:
+                yield data
+            except BaseException:
+                with self._txn_lock:
+                    self._txn = self._txn_owner = None
+                raise
+            with self._txn_lock:
+                try:
+                    _atomic_write(out_path, data)
+                    _journal_path(out_path).unlink(missing_ok=True)
+                finally:
+                    self._txn = self._txn_owner = None
+
+
+def _lock_path(path: Path) -> Path:
+    return path.with_name(path.name + ".lock")
+
+
+def _journal_path(path: Path) -> Path:
+    return path.with_name(path.name + ".journal")
+
+
+def _stat_key(path: Path) -> _StatKey | None:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _append_journal(path: Path, updates: list[tuple[str, dict]]) -> None:
+    # one JSON line per update; caller holds the registry lock
+    payload = "".join(
+        json.dumps({"dataset_id": ds, "update": u}, ensure_ascii=False) + "\n"
+        for ds, u in updates
+    ).encode("utf-8")
+    with metrics.span("registry.write", mode="journal"), path.open("a+b") as f:
+        if f.seek(0, os.SEEK_END):
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                # terminate a record torn by a crash so it stays a separate line
+                payload = b"\n" + payload
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_journal(path: Path) -> list[tuple[str, dict]]:
+    try:
+        raw = path.read_bytes()
+    except FileNotFoundError:
+        return []
+    records = []
+    for line in raw.splitlines():
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            continue  # torn by a crash mid-append
+        records.append((rec["dataset_id"], rec["update"]))
+    return records
+
+
+def _atomic_write(path: Path, data: dict[str, Any]) -> None:
+    with metrics.span("registry.write", mode="full"):
+        _write_yaml(path, data)
+
+
+def _write_yaml(path: Path, data: dict[str, Any]) -> None:
+    text = yaml.dump(data, Dumper=_Dumper, sort_keys=False, allow_unicode=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates 0600; keep the registry as readable as before
+        os.chmod(tmp, path.stat().st_mode & 0o777 if path.exists() else 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def _synced_files(files: list[dict], record: dict) -> list[dict]:
+    # registry file entries refreshed from a published record's file list
+    remote = {f.get("key") or f.get("filename"): f for f in record.get("files") or []}
+    out = []
+    for f in files:
+        rf = remote.get(f.get("name")) or {}
+        links = rf.get("links") or {}
+        fresh = {
+            "checksum": rf.get("checksum"),
+            "size": rf.get("size") or rf.get("filesize"),
+            "download_url": links.get("download")
+            or links.get("content")
+            or links.get("self"),
+        }
+        out.append({**f, **{k: v for k, v in fresh.items() if v is not None}})
+    return out
+
+
+def _version_key(entry: dict) -> tuple[Any, Any]:
+    return entry.get("version"), entry.get("recid")
+
+
+def _merge_version(data: dict[str, Any], dataset_id: str, update: dict) -> None:
+    data["datasets"].setdefault(dataset_id, {})
+    # shallow-merge for now
+    existing = data["datasets"][dataset_id]
+    # if there's an existing zenodo.versions, append new versions rather than overwrite
+    if (
+        "zenodo" in existing
+        and "versions" in existing["zenodo"]
+        and "zenodo" in update
+        and "versions" in update["zenodo"]
+    ):
+        # append versions, skipping any already registered: a publish that
+        # crashed after its registry write re-applies the same update on resume
+        existing_versions = existing["zenodo"].get("versions", [])
+        have = {_version_key(v) for v in existing_versions}
+        new_versions = [
+            v
+            for v in update["zenodo"].get("versions", [])
+            if _version_key(v) not in have
+        ]
+        existing["zenodo"]["versions"] = existing_versions + new_versions
+        # copy other zenodo keys
+        for k, v in update["zenodo"].items():
+            if k != "versions":
+                existing["zenodo"][k] = v
+    else:
+        # overwrite/merge top-level keys
+        existing.update(update)
+    data["datasets"][dataset_id] = existing
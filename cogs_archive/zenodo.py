@@ -1,16 +1,105 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-import requests
+from typing import Callable, Optional
+import json
+import os
+import re
+import tempfile
+import time
 
+from . import metrics
 from .exceptions import ZenodoError
 
+# before requests: .http explains how to install it when it is missing
+from .http import RateLimiter, make_session, shared_rate_limiter
+import requests
+
+# progress(filename, bytes_sent, bytes_total); called from upload threads
+UploadProgress = Callable[[str, int, Optional[int]], None]
+# on_done(file_path, upload_response); called from upload threads
+UploadDone = Callable[[Path, dict], None]
+
+# numeric ids and bucket UUIDs, collapsed so metrics group by endpoint
+_URL_IDS = re.compile(r"/(?:\d+|[0-9a-f]{8}-[0-9a-f-]{27})(?=/|$)")
+
+
+class _ProgressReader:
+    """File wrapper that reports bytes as requests/http.client reads them."""
+
+    def __init__(self, f, name: str, total: int, progress: UploadProgress):
+        self._f = f
+        self._name = name
+        self._total = total
+        self._progress = progress
+        self._sent = 0
+
+    def __len__(self) -> int:
+        # lets requests send a Content-Length instead of chunked encoding
+        return self._total
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._f.read(size)
+        if chunk:
+            self._sent += len(chunk)
+            self._progress(self._name, self._sent, self._total)
+        return chunk
+
+
+@dataclass(frozen=True)
+class Deposition:
+    """
+    Handle on a draft deposition that keeps the links Zenodo returned with it,
+    so uploads can go straight to the bucket without re-fetching the draft.
+    """
+
+    id: int
+    links: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Deposition":
+        return cls(id=data["id"], links=dict(data.get("links") or {}))
+
+    @property
+    def bucket_url(self) -> str | None:
+        return self.links.get("bucket")
+
 
 @dataclass(frozen=True)
 class ZenodoClient:
     access_token: str
     base_url: str = "https://zenodo.org/api"
     timeout_s: int = 60
+    # uploads wait for Zenodo to store (and checksum) the whole body
+    upload_timeout_s: int = 600
+    max_retries: int = 5
+    backoff_s: float = 1.0
+    # connections kept alive per host; size it to the upload/fetch concurrency
+    pool_size: int = 10
+    # on-disk cache of get_record() responses, revalidated with If-None-Match
+    record_cache_dir: Path | None = None
+    # request budget for this token; defaults to one shared by every client
+    # of the same token in the process, whose budget the first client sets
+    requests_per_min: float = 100
+    rate_limiter: RateLimiter | None = field(default=None, compare=False, repr=False)
+    session: requests.Session | None = field(default=None, compare=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.session is None:
+            object.__setattr__(
+                self,
+                "session",
+                make_session(pool_size=self.pool_size, retries=self.max_retries),
+            )
+        if self.rate_limiter is None:
+            object.__setattr__(
+                self,
+                "rate_limiter",
+                shared_rate_limiter(
+                    self.base_url, self.access_token, self.requests_per_min
+                ),
+            )
 
     def _headers(self) -> dict:
         return {"Accept": "application/json"}
@@ -18,9 +107,48 @@ class ZenodoClient:
     def _params(self) -> dict:
         return {"access_token": self.access_token}
 
+    def _request(
+        self,
+        method: str,
+        url: str,
+        replayable: bool = True,
+        endpoint: str | None = None,
+        **kwargs,
+    ) -> requests.Response:
+        """
+        Send one API request paced by the rate limiter. A 429 pauses every
+        thread sharing the limiter and, if the request can be replayed, is
+        retried up to max_retries times; otherwise the 429 is returned.
+        """
+        if endpoint is None and metrics.enabled():
+            endpoint = self._endpoint(url)
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            with metrics.span("zenodo.request", method=method, endpoint=endpoint):
+                r = self.session.request(method, url, **kwargs)
+            metrics.count(
+                "zenodo.requests",
+                method=method,
+                endpoint=endpoint,
+                status=r.status_code,
+            )
+            if self.rate_limiter.observe(r) is None and r.status_code == 429:
+                self.rate_limiter.pause(self.backoff_s * 2**attempt)
+            if r.status_code != 429 or not replayable or attempt >= self.max_retries:
+                return r
+            attempt += 1
+            metrics.count("zenodo.retries", endpoint=endpoint)
+
+    def _endpoint(self, url: str) -> str:
+        # ".../depositions/123/actions/publish" -> "/depositions/{id}/actions/publish"
+        path = url.removeprefix(self.base_url).split("?", 1)[0]
+        return _URL_IDS.sub("/{id}", path)
+
     def create_deposition(self) -> dict:
         url = f"{self.base_url}/deposit/depositions"
-        r = requests.post(
+        r = self._request(
+            "POST",
             url,
             params=self._params(),
             json={},
@@ -34,7 +162,8 @@ class ZenodoClient:
     def update_metadata(self, deposition_id: int, metadata: dict) -> dict:
         url = f"{self.base_url}/deposit/depositions/{deposition_id}"
         payload = {"metadata": metadata}
-        r = requests.put(
+        r = self._request(
+            "PUT",
             url,
             params=self._params(),
             json=payload,
@@ -45,46 +174,212 @@ class ZenodoClient:
             raise ZenodoError(f"Update metadata failed: {r.status_code} {r.text}")
         return r.json()
 
-    def upload_file(self, deposition_id: int, file_path: Path) -> dict:
+    def open_deposition(self, deposition: int | dict | Deposition) -> Deposition:
+        """
+        Return a Deposition handle with a bucket link, fetching the draft only
+        when the id or response at hand does not already carry one.
+        """
+        if isinstance(deposition, dict):
+            deposition = Deposition.from_json(deposition)
+        if isinstance(deposition, Deposition):
+            if deposition.bucket_url:
+                return deposition
+            deposition = deposition.id
+        return Deposition.from_json(self.get_deposition(deposition))
+
+    def upload_file(
+        self,
+        deposition: int | Deposition,
+        file_path: Path,
+        progress: UploadProgress | None = None,
+    ) -> dict:
+        """
+        Stream one file into the deposition bucket. 5xx responses and dropped
+        connections are retried with exponential backoff, re-sending the file
+        from the start; 429s are re-sent once the rate limiter allows.
+
+        Pass a Deposition from open_deposition() to skip looking up the bucket
+        link; a bare id costs one extra GET per call.
+        """
         # Zenodo deposit API supports multipart upload to the deposition "bucket"
-        dep = self.get_deposition(deposition_id)
-        bucket_url = dep["links"]["bucket"]
-
-        with file_path.open("rb") as f:
-            url = f"{bucket_url}/{file_path.name}"
-            r = requests.put(
-                url,
-                params=self._params(),
-                data=f,
-                headers=self._headers(),
-                timeout=self.timeout_s,
-            )
+        bucket_url = self.open_deposition(deposition).bucket_url
+        url = f"{bucket_url}/{file_path.name}"
+        total = os.path.getsize(file_path)
+
+        attempt = 0
+        while True:
+            try:
+                with file_path.open("rb") as f:
+                    body = (
+                        _ProgressReader(f, file_path.name, total, progress)
+                        if progress is not None
+                        else f
+                    )
+                    r = self._request(
+                        "PUT",
+                        url,
+                        replayable=False,
+                        endpoint="bucket",
+                        params=self._params(),
+                        data=body,
+                        headers=self._headers(),
+                        timeout=(self.timeout_s, self.upload_timeout_s),
+                    )
+                if attempt >= self.max_retries:
+                    break
+                if r.status_code == 429:
+                    # the limiter is already paused for the server's window
+                    attempt += 1
+                    metrics.count("zenodo.retries", endpoint="bucket")
+                    continue
+                if r.status_code < 500:
+                    break
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+            attempt += 1
+            metrics.count("zenodo.retries", endpoint="bucket")
+            time.sleep(self.backoff_s * 2 ** (attempt - 1))
+
         if not r.ok:
             raise ZenodoError(f"Upload failed: {r.status_code} {r.text}")
+        metrics.count("zenodo.bytes_sent", total)
         return r.json()
 
+    def upload_files(
+        self,
+        deposition: int | Deposition,
+        files: list[Path],
+        workers: int = 4,
+        progress: UploadProgress | None = None,
+        on_done: UploadDone | None = None,
+    ) -> list[dict]:
+        """
+        Upload several files into one deposition, up to `workers` at a time.
+        The bucket link is resolved once for the whole batch. Results are in
+        the order of `files`; `on_done` is called as each file finishes.
+        """
+        dep = self.open_deposition(deposition)
+        if not files:
+            return []
+
+        def upload_one(fp: Path) -> dict:
+            res = self.upload_file(dep, fp, progress=progress)
+            if on_done is not None:
+                on_done(fp, res)
+            return res
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(files)))) as pool:
+            return list(pool.map(upload_one, files))
+
     def publish(self, deposition_id: int) -> dict:
         url = f"{self.base_url}/deposit/depositions/{deposition_id}/actions/publish"
-        r = requests.post(
-            url, params=self._params(), headers=self._headers(), timeout=self.timeout_s
+        r = self._request(
+            "POST",
+            url,
+            params=self._params(),
+            headers=self._headers(),
+            timeout=self.timeout_s,
         )
         if not r.ok:
             raise ZenodoError(f"Publish failed: {r.status_code} {r.text}")
         return r.json()
 
+    def new_version(self, deposition_id: int) -> dict:
+        """
+        Open a draft for a new version of a published deposition and return
+        it. Zenodo copies the previous version's files into the draft, so
+        unchanged files need not be uploaded again.
+        """
+        url = f"{self.base_url}/deposit/depositions/{deposition_id}/actions/newversion"
+        r = self._request(
+            "POST",
+            url,
+            params=self._params(),
+            headers=self._headers(),
+            timeout=self.timeout_s,
+        )
+        if not r.ok:
+            raise ZenodoError(f"New version failed: {r.status_code} {r.text}")
+        draft_url = r.json()["links"]["latest_draft"]
+        r = self._request(
+            "GET",
+            draft_url,
+            params=self._params(),
+            headers=self._headers(),
+            timeout=self.timeout_s,
+        )
+        if not r.ok:
+            raise ZenodoError(f"Get deposition failed: {r.status_code} {r.text}")
+        return r.json()
+
+    def delete_file(self, deposition_id: int, file_id: str) -> None:
+        url = f"{self.base_url}/deposit/depositions/{deposition_id}/files/{file_id}"
+        r = self._request(
+            "DELETE",
+            url,
+            params=self._params(),
+            headers=self._headers(),
+            timeout=self.timeout_s,
+        )
+        if not r.ok:
+            raise ZenodoError(f"Delete file failed: {r.status_code} {r.text}")
+
     def get_deposition(self, deposition_id: int) -> dict:
         url = f"{self.base_url}/deposit/depositions/{deposition_id}"
-        r = requests.get(
-            url, params=self._params(), headers=self._headers(), timeout=self.timeout_s
+        r = self._request(
+            "GET",
+            url,
+            params=self._params(),
+            headers=self._headers(),
+            timeout=self.timeout_s,
         )
         if not r.ok:
             raise ZenodoError(f"Get deposition failed: {r.status_code} {r.text}")
         return r.json()
 
     def get_record(self, recid: int) -> dict:
+        """
+        Fetch a published record. With `record_cache_dir` set, responses are
+        kept on disk with their ETag and revalidated, so an unchanged record
+        costs a body-less 304.
+        """
         # published record endpoint
         url = f"{self.base_url}/records/{recid}"
-        r = requests.get(url, headers=self._headers(), timeout=self.timeout_s)
+        headers = self._headers()
+        cached = self._cached_record(recid)
+        if cached is not None:
+            headers["If-None-Match"] = cached["etag"]
+        r = self._request("GET", url, headers=headers, timeout=self.timeout_s)
+        if r.status_code == 304 and cached is not None:
+            return cached["record"]
         if not r.ok:
             raise ZenodoError(f"Get record failed: {r.status_code} {r.text}")
-        return r.json()
+        record = r.json()
+        etag = r.headers.get("ETag")
+        if self.record_cache_dir is not None and etag:
+            self._store_record(recid, etag, record)
+        return record
+
+    def _record_cache_path(self, recid: int) -> Path:
+        return Path(self.record_cache_dir) / f"{recid}.json"
+
+    def _cached_record(self, recid: int) -> dict | None:
+        if self.record_cache_dir is None:
+            return None
+        try:
+            return json.loads(self._record_cache_path(recid).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _store_record(self, recid: int, etag: str, record: dict) -> None:
+        path = self._record_cache_path(recid)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"etag": etag, "record": record}, f)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
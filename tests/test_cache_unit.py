@@ -0,0 +1,408 @@
+# tests/test_cache_unit.py
+import hashlib
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+import requests
+
+from cogs_archive import locking, metrics
+from cogs_archive.cache import Cache
+from cogs_archive.http import RateLimiter
+from cogs_archive.locking import file_lock, try_file_lock
+from cogs_archive.exceptions import ChecksumError
+
+PAYLOAD = bytes(range(256)) * 4096 * 4  # 4 MiB
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    # first request is cut off after this many bytes, later ones succeed
+    truncate_first_at = None
+    # this many requests are answered with a 429 first
+    throttle_first = 0
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        rng = self.headers.get("Range")
+        self.requests_seen.append(rng)
+        if type(self).throttle_first:
+            type(self).throttle_first -= 1
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        start = int(rng[len("bytes=") : -1]) if rng else 0
+        if start >= len(PAYLOAD):
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(PAYLOAD)}")
+            self.end_headers()
+            return
+        body = PAYLOAD[start:]
+        self.send_response(206 if rng else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        cut = type(self).truncate_first_at
+        if cut is not None:
+            type(self).truncate_first_at = None
+            self.wfile.write(body[:cut])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    _RangeHandler.requests_seen = []
+    _RangeHandler.truncate_first_at = None
+    _RangeHandler.throttle_first = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _RangeHandler)
+    t = threading.Thread(target=httpd.serve_forever, daemon=True)
+    t.start()
+    yield _RangeHandler, f"http://127.0.0.1:{httpd.server_address[1]}/file.bin"
+    httpd.shutdown()
+
+
+def test_download_resumes_with_range_after_dropped_connection(
+    tmp_path, server, monkeypatch
+):
+    monkeypatch.setattr("cogs_archive.cache.time.sleep", lambda s: None)
+    handler, url = server
+    # only whole 1 MiB chunks reach the .part file before the drop
+    handler.truncate_first_at = 2_500_000
+    dest = tmp_path / "file.bin"
+
+    digest = Cache(tmp_path).download(url, dest)
+
+    assert dest.read_bytes() == PAYLOAD
+    assert digest == "md5:" + hashlib.md5(PAYLOAD).hexdigest()
+    assert handler.requests_seen == [None, "bytes=2097152-"]
+    assert not (tmp_path / "file.bin.part").exists()
+
+
+def test_rate_limited_download_waits_for_the_limiter_and_retries(
+    tmp_path, server, monkeypatch
+):
+    sleeps = []
+    monkeypatch.setattr("cogs_archive.cache.time.sleep", sleeps.append)
+    handler, url = server
+    handler.throttle_first = 2
+    limiter = RateLimiter(per_minute=6000)
+    pauses = []
+    pause = limiter.pause
+    monkeypatch.setattr(limiter, "pause", lambda s: pauses.append(s) or pause(s))
+    cache = Cache(tmp_path, rate_limiter=limiter)
+
+    digest = cache.download(url, tmp_path / "file.bin")
+    handler.throttle_first = 1
+    with cache.stream(url, tmp_path / "streamed.bin") as stream:
+        assert stream.read() == PAYLOAD
+
+    assert digest == "md5:" + hashlib.md5(PAYLOAD).hexdigest()
+    assert (tmp_path / "file.bin").read_bytes() == PAYLOAD
+    # each Retry-After pauses the limiter instead of a backoff sleep
+    assert pauses == [0.0, 0.0, 0.0] and sleeps == []
+
+
+def test_download_gives_up_on_persistent_rate_limiting(tmp_path, server):
+    handler, url = server
+    handler.throttle_first = 3
+    cache = Cache(tmp_path, rate_limiter=RateLimiter(per_minute=6000))
+
+    with pytest.raises(requests.HTTPError, match="429"):
+        cache.download(url, tmp_path / "file.bin", retries=2)
+    assert handler.throttle_first == 0
+
+
+def test_instrumented_fetch_reports_bytes_retries_and_hits(
+    tmp_path, server, monkeypatch
+):
+    monkeypatch.setattr("cogs_archive.cache.time.sleep", lambda s: None)
+    handler, url = server
+    handler.truncate_first_at = 2_500_000
+    checksum = "md5:" + hashlib.md5(PAYLOAD).hexdigest()
+    cache = Cache(tmp_path)
+    views = [tmp_path / v / "file.bin" for v in ("v1", "v2")]
+
+    with metrics.instrumented(metrics.Recorder()) as rec:
+        for dest in views:
+            dest.parent.mkdir()
+            cache.fetch_file(url, dest, checksum=checksum)
+
+    assert rec.counters["cache.misses"] == 1
+    assert rec.counters["cache.hits"] == 1
+    assert rec.counters["cache.retries"] == 1
+    assert rec.counters["cache.bytes_received"] == len(PAYLOAD)
+    assert rec.counters["cache.hash_seconds"] > 0
+    assert len(rec.spans["cache.download"]) == 1
+    assert not metrics.enabled()
+
+
+def test_download_picks_up_leftover_part_file(tmp_path, server):
+    handler, url = server
+    dest = tmp_path / "file.bin"
+    (tmp_path / "file.bin.part").write_bytes(PAYLOAD[:1000])
+
+    Cache(tmp_path).download(url, dest)
+
+    assert dest.read_bytes() == PAYLOAD
+    assert handler.requests_seen == ["bytes=1000-"]
+
+
+def test_download_checks_digest_of_resumed_stream(tmp_path, server):
+    handler, url = server
+    dest = tmp_path / "file.bin"
+    (tmp_path / "file.bin.part").write_bytes(b"x" * 1000)  # corrupt prefix
+
+    with pytest.raises(ChecksumError):
+        Cache(tmp_path).download(
+            url, dest, checksum="md5:" + hashlib.md5(PAYLOAD).hexdigest()
+        )
+
+    assert not dest.exists()
+    assert not (tmp_path / "file.bin.part").exists()
+
+
+def test_lock_file_may_be_deleted_by_its_holder(tmp_path):
+    path = tmp_path / "obj.lock"
+    script = f"""
+import sys
+from pathlib import Path
+from cogs_archive.locking import file_lock
+with file_lock(Path({str(path)!r})):
+    print("locked", flush=True)
+    sys.stdin.readline()
+"""
+    with file_lock(path):
+        waiter = subprocess.Popen(
+            [sys.executable, "-c", script],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        time.sleep(0.5)  # let it open the file and block in flock()
+        path.unlink()
+    assert waiter.stdout.readline() == "locked\n"
+
+    # the waiter locked the recreated file, not the deleted one
+    with try_file_lock(path) as acquired:
+        assert not acquired
+    waiter.communicate("\n", timeout=10)
+    assert locking._thread_locks == {}
+
+
+def test_concurrent_processes_download_a_shared_object_once(tmp_path, server):
+    handler, url = server
+    checksum = "md5:" + hashlib.md5(PAYLOAD).hexdigest()
+    script = f"""
+import sys
+from pathlib import Path
+from cogs_archive.cache import Cache
+cache = Cache(Path({str(tmp_path)!r}))
+dest = cache.path_for("shared_ds", "file.bin", sys.argv[1])
+assert cache.fetch_file({url!r}, dest, checksum={checksum!r}).read_bytes()[:4] == bytes(range(4))
+"""
+    workers = [
+        subprocess.Popen([sys.executable, "-c", script, f"1.0.{i}"]) for i in range(4)
+    ]
+
+    assert [w.wait(timeout=60) for w in workers] == [0, 0, 0, 0]
+    assert handler.requests_seen == [None]
+    for i in range(4):
+        view = tmp_path / "shared_ds" / f"1.0.{i}" / "file.bin"
+        assert view.read_bytes() == PAYLOAD
+    assert not list(tmp_path.rglob("*.part")) and not list(tmp_path.rglob("*.link"))
+
+
+def test_processes_streaming_and_fetching_one_object_keep_one_copy(tmp_path, server):
+    handler, url = server
+    checksum = "md5:" + hashlib.md5(PAYLOAD).hexdigest()
+    script = f"""
+import sys
+from pathlib import Path
+from cogs_archive.cache import Cache
+cache = Cache(Path({str(tmp_path)!r}))
+mode, version = sys.argv[1:]
+dest = cache.path_for("shared_ds", "file.bin", version)
+if mode == "stream":
+    with cache.stream({url!r}, dest, checksum={checksum!r}, tee=True) as f:
+        data = f.read()
+else:
+    data = cache.fetch_file({url!r}, dest, checksum={checksum!r}).read_bytes()
+assert data == bytes(range(256)) * 4096 * 4
+"""
+    modes = ["stream", "fetch", "stream", "fetch"]
+    workers = [
+        subprocess.Popen([sys.executable, "-c", script, mode, f"1.0.{i}"])
+        for i, mode in enumerate(modes)
+    ]
+
+    assert [w.wait(timeout=60) for w in workers] == [0, 0, 0, 0]
+    # nobody resumed a .part another process had truncated or appended to
+    assert set(handler.requests_seen) == {None}
+    assert Cache(tmp_path).object_path(checksum).read_bytes() == PAYLOAD
+    for i, mode in enumerate(modes):
+        if mode == "fetch":
+            view = tmp_path / "shared_ds" / f"1.0.{i}" / "file.bin"
+            assert view.read_bytes() == PAYLOAD
+    assert not list(tmp_path.rglob("*.part")) and not list(tmp_path.rglob("*.link"))
+
+
+def test_stream_reads_through_resumes_and_tees_into_cache(
+    tmp_path, server, monkeypatch
+):
+    monkeypatch.setattr("cogs_archive.cache.time.sleep", lambda s: None)
+    handler, url = server
+    handler.truncate_first_at = 1_000_000
+    checksum = "md5:" + hashlib.md5(PAYLOAD).hexdigest()
+    cache = Cache(tmp_path)
+    dest = cache.path_for("test_ds", "file.bin", "1.0.0")
+    completed = []
+
+    with io.BufferedReader(
+        cache.stream(
+            url,
+            dest,
+            checksum=checksum,
+            tee=True,
+            read_ahead=512 * 1024,
+            on_complete=lambda: completed.append(True),
+        )
+    ) as f:
+        head = f.read(100)
+        assert head == PAYLOAD[:100]
+        assert head + f.read() == PAYLOAD
+
+    assert handler.requests_seen[0] is None
+    assert handler.requests_seen[1].startswith("bytes=")
+    assert completed == [True]
+    assert dest.read_bytes() == PAYLOAD
+    assert cache.index.is_verified(cache.object_path(checksum), checksum)
+
+
+def test_stream_raises_on_checksum_mismatch_and_keeps_nothing(tmp_path, server):
+    _, url = server
+    cache = Cache(tmp_path)
+    dest = cache.path_for("test_ds", "file.bin", "1.0.0")
+    checksum = "md5:" + "0" * 32
+
+    with cache.stream(url, dest, checksum=checksum, tee=True) as f:
+        with pytest.raises(ChecksumError):
+            while f.read(1024 * 1024):
+                pass
+
+    assert not dest.exists()
+    assert not list(cache.object_path(checksum).parent.iterdir())
+
+
+def test_stream_tee_and_fetch_of_one_object_share_a_single_download(tmp_path, server):
+    handler, url = server
+    checksum = "md5:" + hashlib.md5(PAYLOAD).hexdigest()
+    cache = Cache(tmp_path)
+    streamed = cache.path_for("a", "file.bin", "1.0.0")
+    fetched = cache.path_for("b", "file.bin", "1.0.0")
+
+    with cache.stream(url, streamed, checksum=checksum, tee=True) as f:
+        head = f.read(1024)
+        fetcher = threading.Thread(
+            target=cache.fetch_file, args=(url, fetched), kwargs={"checksum": checksum}
+        )
+        fetcher.start()
+        assert head + f.read() == PAYLOAD
+    fetcher.join()
+
+    # the fetch waited for the tee and reused its verified copy
+    assert handler.requests_seen == [None]
+    assert streamed.read_bytes() == fetched.read_bytes() == PAYLOAD
+    assert os.path.samefile(fetched, cache.object_path(checksum))
+
+
+def test_stream_tee_does_not_wait_for_the_reader(tmp_path, server):
+    handler, url = server
+    checksum = "md5:" + hashlib.md5(PAYLOAD).hexdigest()
+    cache = Cache(tmp_path)
+    streamed = cache.path_for("a", "file.bin", "1.0.0")
+    fetched = cache.path_for("b", "file.bin", "1.0.0")
+    result = []
+
+    def read_a_little_then_fetch():
+        # the reader itself waits on the tee's lock; the tee must finish the
+        # download without the reader draining it
+        with cache.stream(
+            url, streamed, checksum=checksum, tee=True, read_ahead=256 * 1024
+        ) as f:
+            head = f.read(100)
+            cache.fetch_file(url, fetched, checksum=checksum)
+            result.append(head + f.read())
+
+    t = threading.Thread(target=read_a_little_then_fetch, daemon=True)
+    t.start()
+    t.join(timeout=30)
+
+    assert not t.is_alive()
+    assert result == [PAYLOAD]
+    assert handler.requests_seen == [None]
+    assert fetched.read_bytes() == PAYLOAD
+
+
+@pytest.mark.parametrize("failing", ["lock", "part"])
+def test_stream_read_raises_errors_from_the_background_thread(
+    tmp_path, server, monkeypatch, failing
+):
+    _, url = server
+    cache = Cache(tmp_path)
+    dest = cache.path_for("test_ds", "file.bin", "1.0.0")
+
+    def broken(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    if failing == "lock":
+        monkeypatch.setattr("cogs_archive.cache.try_file_lock", broken)
+    else:
+        real_open = Path.open
+        monkeypatch.setattr(
+            Path,
+            "open",
+            lambda self, *a, **k: (
+                broken() if self.name.endswith(".part") else real_open(self, *a, **k)
+            ),
+        )
+
+    with cache.stream(url, dest, tee=True) as f:
+        with pytest.raises(OSError, match="No space left"):
+            f.read()
+
+
+def test_stream_skips_the_tee_while_another_download_holds_the_lock(tmp_path, server):
+    _, url = server
+    checksum = "md5:" + hashlib.md5(PAYLOAD).hexdigest()
+    cache = Cache(tmp_path)
+    dest = cache.path_for("test_ds", "file.bin", "1.0.0")
+    obj = cache.object_path(checksum)
+    part = obj.with_name(obj.name + ".part")
+    completed = []
+
+    with file_lock(cache._lock_path(obj)):
+        # another download's partial copy of the same object
+        obj.parent.mkdir(parents=True)
+        part.write_bytes(PAYLOAD[:1000])
+        with cache.stream(
+            url,
+            dest,
+            checksum=checksum,
+            tee=True,
+            on_complete=lambda: completed.append(True),
+        ) as f:
+            assert f.read() == PAYLOAD
+
+    assert part.read_bytes() == PAYLOAD[:1000]  # left to its owner
+    assert not obj.exists() and not dest.exists() and completed == []
@@ -0,0 +1,322 @@
+# tests/test_fetch_unit.py
+import asyncio
+import hashlib
+import os
+import subprocess
+import sys
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from cogs_archive import aio
+from cogs_archive.cache import BandwidthLimiter, Cache, shared_bandwidth_limiter
+from cogs_archive.dataset import RegisteredDataset
+from cogs_archive.registry import DatasetRegistry
+
+
+def _spec(n_files):
+    files = []
+    for i in range(n_files):
+        body = f"file {i}".encode()
+        files.append(
+            {
+                "name": f"part{i}.csv",
+                "checksum": "md5:" + hashlib.md5(body).hexdigest(),
+                "download_url": f"https://fake/{i}",
+            }
+        )
+    return {"zenodo": {"versions": [{"version": "1.0.0", "files": files}]}}
+
+
+def test_fetch_downloads_concurrently_and_keeps_order(tmp_path, monkeypatch):
+    monkeypatch.setenv("LABARCHIVE_CACHE_DIR", str(tmp_path))
+    # every worker must be inside download() at once for the barrier to release
+    barrier = threading.Barrier(4, timeout=5)
+    threads = set()
+    seen = []
+
+    def fake_download(self, url, dest, progress=None, limiter=None, checksum=None):
+        threads.add(threading.get_ident())
+        barrier.wait()
+        body = f"file {url.rsplit('/', 1)[1]}".encode()
+        dest.write_bytes(body)
+        progress(dest.name, len(body), len(body))
+
+    monkeypatch.setattr(Cache, "download", fake_download)
+    ds = RegisteredDataset(dataset_id="test_ds", spec=_spec(8))
+
+    paths = ds.fetch(workers=4, progress=lambda name, done, total: seen.append(name))
+
+    assert [p.name for p in paths] == [f"part{i}.csv" for i in range(8)]
+    assert sorted(seen) == sorted(p.name for p in paths)
+    assert len(threads) == 4
+
+
+def test_lookups_and_cache_hits_do_not_import_http_stack(tmp_path, monkeypatch):
+    monkeypatch.setenv("LABARCHIVE_CACHE_DIR", str(tmp_path / "cache"))
+    registry = tmp_path / "data-registry.yaml"
+    DatasetRegistry(registry).upsert_version("test_ds", _spec(2))
+    for i in range(2):
+        body = f"file {i}".encode()
+        obj = Cache(tmp_path / "cache").object_path(
+            "md5:" + hashlib.md5(body).hexdigest()
+        )
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        obj.write_bytes(body)
+
+    script = f"""
+import sys
+import cogs_archive
+ds = cogs_archive.DatasetRegistry({str(registry)!r}).get("test_ds")
+assert [p.read_text() for p in ds.fetch()] == ["file 0", "file 1"]
+heavy = {{"requests", "urllib3", "cogs_archive.zenodo"}} & set(sys.modules)
+assert not heavy, heavy
+"""
+    subprocess.run([sys.executable, "-c", script], check=True, env=os.environ)
+
+
+def test_bandwidth_limiter_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        BandwidthLimiter(0)
+
+
+def test_fetches_share_one_limiter_per_configured_rate(tmp_path, monkeypatch):
+    monkeypatch.setenv("LABARCHIVE_MAX_BYTES_PER_S", "1000000000")
+    limiters = set()
+
+    def fake_download(self, url, dest, progress=None, limiter=None, checksum=None):
+        limiters.add(id(limiter))
+        dest.write_bytes(f"file {url.rsplit('/', 1)[1]}".encode())
+
+    monkeypatch.setattr(Cache, "download", fake_download)
+    # separate caches, so the second fetch downloads too
+    for name in ("a", "b"):
+        monkeypatch.setenv("LABARCHIVE_CACHE_DIR", str(tmp_path / name))
+        RegisteredDataset(dataset_id=name, spec=_spec(2)).fetch()
+
+    assert len(limiters) == 1
+    assert limiters == {id(shared_bandwidth_limiter(1000000000))}
+
+
+def test_warm_fetch_trusts_index_unless_full_verify(tmp_path, monkeypatch):
+    monkeypatch.setenv("LABARCHIVE_CACHE_DIR", str(tmp_path))
+    ds = RegisteredDataset(dataset_id="test_ds", spec=_spec(3))
+    cache = Cache(tmp_path)
+    for f in ds.latest()["files"]:
+        dest = cache.path_for("test_ds", f["name"], "1.0.0")
+        dest.write_bytes(f"file {f['name'][4]}".encode())
+
+    hashed = []
+    real_verify = Cache.verify_checksum
+
+    def counting_verify(self, file_path, checksum):
+        hashed.append(file_path.name)
+        real_verify(self, file_path, checksum)
+
+    monkeypatch.setattr(Cache, "verify_checksum", counting_verify)
+
+    ds.fetch(workers=1)  # first pass hashes and records
+    assert len(hashed) == 3
+    ds.fetch(workers=1)  # warm pass only stats
+    assert len(hashed) == 3
+    ds.fetch(workers=1, verify="full")
+    assert len(hashed) == 6
+
+
+def test_versions_share_content_addressed_objects(tmp_path, monkeypatch):
+    monkeypatch.setenv("LABARCHIVE_CACHE_DIR", str(tmp_path))
+    spec = _spec(2)
+    old = spec["zenodo"]["versions"][0]
+    spec["zenodo"]["versions"].append({"version": "1.1.0", "files": old["files"]})
+    downloads = []
+
+    def fake_download(self, url, dest, progress=None, limiter=None, checksum=None):
+        downloads.append(url)
+        dest.write_bytes(f"file {url.rsplit('/', 1)[1]}".encode())
+
+    monkeypatch.setattr(Cache, "download", fake_download)
+    ds = RegisteredDataset(dataset_id="test_ds", spec=spec)
+
+    v1 = ds.fetch(version="1.0.0", workers=1)
+    v2 = ds.fetch(version="1.1.0", workers=1)
+
+    assert len(downloads) == 2
+    assert v1 != v2
+    for a, b, f in zip(v1, v2, old["files"]):
+        obj = Cache(tmp_path).object_path(f["checksum"])
+        assert a.samefile(obj) and b.samefile(obj)
+
+
+def test_gc_evicts_least_recently_used_unpinned_versions(tmp_path, monkeypatch):
+    monkeypatch.setenv("LABARCHIVE_CACHE_DIR", str(tmp_path))
+    bodies = {v: v.encode() * 100 for v in ("1.0.0", "2.0.0", "3.0.0")}  # 500 B each
+    spec = {
+        "zenodo": {
+            "versions": [
+                {
+                    "version": v,
+                    "files": [
+                        {
+                            "name": "data.csv",
+                            "checksum": "md5:" + hashlib.md5(body).hexdigest(),
+                            "download_url": f"https://fake/{v}",
+                        }
+                    ],
+                }
+                for v, body in bodies.items()
+            ]
+        }
+    }
+
+    def fake_download(self, url, dest, progress=None, limiter=None, checksum=None):
+        dest.write_bytes(bodies[url.rsplit("/", 1)[1]])
+
+    monkeypatch.setattr(Cache, "download", fake_download)
+    ds = RegisteredDataset(dataset_id="test_ds", spec=spec)
+    cache = Cache(tmp_path, max_bytes=1000)
+    cache.pin("test_ds", "1.0.0")
+
+    for v in bodies:
+        ds.fetch(version=v, cache=cache, workers=1)
+
+    usage = cache.usage()
+    assert [(u.version, u.pinned) for u in usage.versions] == [
+        ("1.0.0", True),
+        ("3.0.0", False),
+    ]
+    assert usage.total_bytes == 1000
+    assert not (tmp_path / "test_ds" / "2.0.0").exists()
+
+    report = cache.gc(max_bytes=0)
+    assert report.evicted == [("test_ds", "3.0.0")]
+    assert report.freed_bytes == 500
+    # only the pinned object's lock file is left
+    assert len(list((tmp_path / ".locks").rglob("*.lock"))) == 1
+
+
+def test_record_access_skips_objects_evicted_meanwhile(tmp_path):
+    cache = Cache(tmp_path)
+    kept = cache.path_for("test_ds", "kept.csv", "1.0.0")
+    kept.write_bytes(b"kept")
+    gone = cache.path_for("test_ds", "gone.csv", "1.0.0")
+
+    cache.record_access(
+        "test_ds", "1.0.0", [(kept, None), (gone, "md5:" + hashlib.md5().hexdigest())]
+    )
+
+    assert [v.path for v in cache.index.views()] == [str(kept)]
+
+
+def test_index_can_live_outside_a_shared_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("LABARCHIVE_CACHE_DIR", str(tmp_path / "shared"))
+    monkeypatch.setenv("LABARCHIVE_CACHE_INDEX_DIR", str(tmp_path / "local"))
+
+    def fake_download(self, url, dest, progress=None, limiter=None, checksum=None):
+        dest.write_bytes(f"file {url.rsplit('/', 1)[1]}".encode())
+
+    monkeypatch.setattr(Cache, "download", fake_download)
+    RegisteredDataset(dataset_id="test_ds", spec=_spec(2)).fetch()
+
+    assert not list((tmp_path / "shared").glob("*.sqlite"))
+    (index,) = (tmp_path / "local").glob("*.sqlite")
+    assert index.stat().st_size
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    # all requests block here until every expected download is in flight
+    barrier = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.barrier is not None:
+            self.barrier.wait()
+        body = f"file {self.path.rsplit('/', 1)[1]}".encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_async_fetch_downloads_concurrently_without_blocking_loop(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setenv("LABARCHIVE_CACHE_DIR", str(tmp_path))
+    _FileHandler.barrier = threading.Barrier(4, timeout=5)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _FileHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    spec = _spec(4)
+    for f in spec["zenodo"]["versions"][0]["files"]:
+        f["download_url"] = f["download_url"].replace(
+            "https://fake", f"http://127.0.0.1:{httpd.server_address[1]}"
+        )
+    ds = RegisteredDataset(dataset_id="test_ds", spec=spec)
+
+    async def main():
+        ticks = 0
+        task = asyncio.create_task(aio.fetch(ds, max_concurrency=4))
+        while not task.done():
+            ticks += 1
+            await asyncio.sleep(0.001)
+        return await task, ticks
+
+    try:
+        paths, ticks = asyncio.run(main())
+    finally:
+        httpd.shutdown()
+
+    assert [p.read_bytes() for p in paths] == [f"file {i}".encode() for i in range(4)]
+    assert ticks > 1
+
+
+def test_open_and_mmap_read_cached_files_and_zip_members(tmp_path, monkeypatch):
+    monkeypatch.setenv("LABARCHIVE_CACHE_DIR", str(tmp_path / "cache"))
+    csv = b"year,value\n" + b"2024,1\n" * 1000
+    archive = tmp_path / "bundle.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("stored.csv", csv, compress_type=zipfile.ZIP_STORED)
+        zf.writestr("deflated.csv", csv, compress_type=zipfile.ZIP_DEFLATED)
+    bodies = {"data.csv": csv, "bundle.zip": archive.read_bytes()}
+    spec = {
+        "zenodo": {
+            "versions": [
+                {
+                    "version": "1.0.0",
+                    "files": [
+                        {
+                            "name": name,
+                            "checksum": "md5:" + hashlib.md5(body).hexdigest(),
+                            "download_url": f"https://fake/{name}",
+                        }
+                        for name, body in bodies.items()
+                    ],
+                }
+            ]
+        }
+    }
+    downloads = []
+
+    def fake_download(self, url, dest, progress=None, limiter=None, checksum=None):
+        downloads.append(url)
+        dest.write_bytes(bodies[url.rsplit("/", 1)[1]])
+
+    monkeypatch.setattr(Cache, "download", fake_download)
+    ds = RegisteredDataset(dataset_id="test_ds", spec=spec)
+
+    view = ds.mmap("data.csv")
+    assert view.readonly and view == csv
+    with ds.open("data.csv") as f:
+        assert f.readline() == b"year,value\n"
+    assert downloads == ["https://fake/data.csv"]
+
+    for member in ("stored.csv", "deflated.csv"):
+        view = ds.mmap("bundle.zip", member=member)
+        assert view.readonly and view == csv
+        with ds.open("bundle.zip", member=member) as f:
+            assert f.read() == csv
+    assert len(downloads) == 2
+    with pytest.raises(KeyError):
+        ds.mmap("bundle.zip", member="missing.csv")
@@ -1,11 +1,13 @@
 # tests/test_publish_unit.py
 from pathlib import Path
 import builtins
+import hashlib
 import io
 import pytest
 from unittest.mock import MagicMock, patch
 
 import cogs_archive.publish as publish_module  # or the module where your publish() function lives
+from cogs_archive.zenodo import Deposition
 
 
 @pytest.fixture
@@ -15,7 +17,7 @@ def fake_files(tmp_path):
     return [p]
 
 
-def test_publish_inserts_cogs_community_and_calls_update_metadata(fake_files):
+def test_publish_inserts_cogs_community_and_calls_update_metadata(fake_files, tmp_path):
     # minimal metadata from a student
     input_md = {
         "title": "Test dataset",
@@ -27,12 +29,16 @@ def test_publish_inserts_cogs_community_and_calls_update_metadata(fake_files):
     fake_cfg = MagicMock()
     fake_cfg.zenodo_access_token = "fake-token"
     fake_cfg.zenodo_base_url = "https://sandbox.zenodo.org/api"
-    fake_cfg.registry_path = Path("/nonexistent/data-registry.yaml")
+    fake_cfg.registry_path = tmp_path / "data-registry.yaml"
+    fake_cfg.registry_journal = False
+    fake_cfg.upload_workers = 2
+    fake_cfg.cache_dir = tmp_path / "cache"
 
     # Patch ZenodoClient so we don't do HTTP
     fake_client = MagicMock()
     # create_deposition should return a deposition with an id
     fake_client.create_deposition.return_value = {"id": 1234}
+    fake_client.open_deposition.side_effect = Deposition.from_json
     # update_metadata returns an updated deposition JSON
     fake_client.update_metadata.return_value = {"id": 1234, "metadata": {}}
     # upload_file returns a file dict
@@ -78,3 +84,528 @@ def test_publish_inserts_cogs_community_and_calls_update_metadata(fake_files):
     # Confirm publish returned a DOI etc.
     assert res["doi"] == "10.5281/zenodo.9999"
     assert res["conceptdoi"] == "10.5281/zenodo.8888"
+
+
+def test_publish_many_shares_client_and_writes_registry_once(tmp_path):
+    items = []
+    for i in range(4):
+        fp = tmp_path / f"qcew_{2020 + i}.csv"
+        fp.write_text("a,b\n")
+        items.append(
+            publish_module.PublishItem(
+                dataset_id=f"qcew_{2020 + i}",
+                version="1.0.0",
+                files=[fp],
+                metadata={"title": f"QCEW {2020 + i}"},
+            )
+        )
+    registry_path = tmp_path / "data-registry.yaml"
+
+    fake_cfg = MagicMock()
+    fake_cfg.zenodo_access_token = "fake-token"
+    fake_cfg.zenodo_base_url = "https://sandbox.zenodo.org/api"
+    fake_cfg.upload_workers = 2
+    fake_cfg.registry_journal = False
+    fake_cfg.cache_dir = tmp_path / "cache"
+
+    fake_client = MagicMock()
+    fake_client.create_deposition.return_value = {"id": 1}
+    fake_client.open_deposition.side_effect = Deposition.from_json
+    fake_client.publish.return_value = {"id": 100, "doi": "10.5281/zenodo.100"}
+
+    def fake_update_metadata(dep_id, md):
+        if md["title"] == "QCEW 2022":
+            raise publish_module.ZenodoError("Update metadata failed: 500")
+
+    fake_client.update_metadata.side_effect = fake_update_metadata
+
+    with patch("cogs_archive.publish.load_config", return_value=fake_cfg):
+        with (
+            patch(
+                "cogs_archive.publish.ZenodoClient", return_value=fake_client
+            ) as mock_client_cls,
+            patch(
+                "cogs_archive.publish.DatasetRegistry.upsert_many", autospec=True
+            ) as upsert_many,
+        ):
+            outcomes = publish_module.publish_many(
+                items, registry_path=registry_path, workers=3
+            )
+
+    assert mock_client_cls.call_count == 1
+    assert [o.item.dataset_id for o in outcomes] == [i.dataset_id for i in items]
+    assert [o.ok for o in outcomes] == [True, True, False, True]
+    assert isinstance(outcomes[2].error, publish_module.ZenodoError)
+    assert upsert_many.call_count == 1
+    written = upsert_many.call_args[0][1]
+    assert sorted(ds for ds, _ in written) == ["qcew_2020", "qcew_2021", "qcew_2023"]
+
+
+def test_publish_many_rejects_repeated_dataset(fake_files):
+    items = [
+        publish_module.PublishItem(
+            dataset_id="qcew_2023", version=v, files=fake_files, metadata={}
+        )
+        for v in ("1.0.0", "1.1.0")
+    ]
+    with (
+        patch("cogs_archive.publish.load_config") as load_config,
+        patch("cogs_archive.publish.ZenodoClient") as client_cls,
+    ):
+        with pytest.raises(ValueError, match="qcew_2023"):
+            publish_module.publish_many(items)
+
+    assert not load_config.called
+    assert not client_cls.called
+
+
+def test_rerun_after_crash_resumes_deposition_and_skips_uploaded_files(tmp_path):
+    files = []
+    for i in range(3):
+        fp = tmp_path / f"part{i}.csv"
+        fp.write_text(f"row {i}\n")
+        files.append(fp)
+
+    fake_cfg = MagicMock()
+    fake_cfg.zenodo_access_token = "fake-token"
+    fake_cfg.zenodo_base_url = "https://sandbox.zenodo.org/api"
+    fake_cfg.upload_workers = 1
+    fake_cfg.registry_journal = False
+    fake_cfg.cache_dir = tmp_path / "cache"
+
+    fake_client = MagicMock()
+    fake_client.create_deposition.return_value = {
+        "id": 7,
+        "links": {"bucket": "https://fake/bucket/7"},
+    }
+    fake_client.open_deposition.side_effect = Deposition.from_json
+    fake_client.get_deposition.return_value = {"id": 7, "submitted": False}
+    fake_client.publish.return_value = {"id": 7, "doi": "10.5281/zenodo.7"}
+    uploaded = []
+    crash = [True]
+
+    def flaky_upload_files(handle, pending, workers, progress, on_done):
+        for fp in pending:
+            if fp.name == "part2.csv" and crash:
+                crash.pop()
+                raise ConnectionError("connection reset")
+            data = fp.read_bytes()
+            on_done(
+                fp,
+                {"checksum": "md5:" + hashlib.md5(data).hexdigest(), "size": len(data)},
+            )
+        uploaded.append([fp.name for fp in pending])
+
+    fake_client.upload_files.side_effect = flaky_upload_files
+
+    def run():
+        return publish_module.publish(
+            dataset_id="test_ds",
+            files=files,
+            metadata={"title": "Test dataset"},
+            version="0.1.0",
+            registry_path=tmp_path / "data-registry.yaml",
+        )
+
+    with (
+        patch("cogs_archive.publish.load_config", return_value=fake_cfg),
+        patch("cogs_archive.publish.ZenodoClient", return_value=fake_client),
+    ):
+        with pytest.raises(ConnectionError):
+            run()
+        res = run()
+
+    assert res["doi"] == "10.5281/zenodo.7"
+    assert fake_client.create_deposition.call_count == 1
+    assert uploaded[-1] == ["part2.csv"]
+    assert fake_client.publish.call_count == 1
+    assert not list((tmp_path / "cache" / "publish-state").iterdir())
+
+
+def test_rerun_after_crash_past_registry_write_does_not_duplicate_version(
+    fake_files, tmp_path
+):
+    from cogs_archive.publish_state import PublishState
+    from cogs_archive.registry import DatasetRegistry
+
+    fake_cfg = MagicMock()
+    fake_cfg.zenodo_access_token = "fake-token"
+    fake_cfg.zenodo_base_url = "https://sandbox.zenodo.org/api"
+    fake_cfg.upload_workers = 1
+    fake_cfg.registry_journal = False
+    fake_cfg.cache_dir = tmp_path / "cache"
+
+    fake_client = MagicMock()
+    fake_client.create_deposition.return_value = {
+        "id": 7,
+        "links": {"bucket": "https://fake/bucket/7"},
+    }
+    fake_client.open_deposition.side_effect = Deposition.from_json
+    fake_client.publish.return_value = {"id": 7, "doi": "10.5281/zenodo.7"}
+
+    clear = PublishState.clear
+    crash = [True]
+
+    def flaky_clear(self):
+        # dies after the registry was written, before the state was dropped
+        if crash:
+            crash.pop()
+            raise OSError("disk full")
+        return clear(self)
+
+    def run():
+        return publish_module.publish(
+            dataset_id="test_ds",
+            files=fake_files,
+            metadata={"title": "Test dataset"},
+            version="1.0.0",
+            registry_path=tmp_path / "data-registry.yaml",
+        )
+
+    with (
+        patch("cogs_archive.publish.load_config", return_value=fake_cfg),
+        patch("cogs_archive.publish.ZenodoClient", return_value=fake_client),
+        patch.object(PublishState, "clear", flaky_clear),
+    ):
+        with pytest.raises(OSError):
+            run()
+        run()
+
+    ds = DatasetRegistry(tmp_path / "data-registry.yaml").get("test_ds")
+    assert [v["version"] for v in ds.spec["zenodo"]["versions"]] == ["1.0.0"]
+    assert fake_client.publish.call_count == 1
+
+
+def test_new_version_carries_forward_unchanged_files(tmp_path):
+    from cogs_archive.registry import DatasetRegistry
+
+    local = {"a.csv": b"same\n", "b.csv": b"edited\n", "c.csv": b"new\n"}
+    files = []
+    for name, body in local.items():
+        fp = tmp_path / name
+        fp.write_bytes(body)
+        files.append(fp)
+    registry_path = tmp_path / "data-registry.yaml"
+    DatasetRegistry(registry_path).upsert_version(
+        "test_ds",
+        {
+            "zenodo": {
+                "versions": [
+                    {
+                        "version": "1.0.0",
+                        "recid": 50,
+                        "files": [
+                            # bare hex, as Zenodo's deposit API reports it
+                            {
+                                "name": "a.csv",
+                                "checksum": hashlib.md5(b"same\n").hexdigest(),
+                            },
+                            {"name": "b.csv", "checksum": "md5:" + "0" * 32},
+                            {"name": "old.csv", "checksum": "md5:" + "1" * 32},
+                        ],
+                    }
+                ]
+            }
+        },
+    )
+
+    fake_cfg = MagicMock()
+    fake_cfg.zenodo_access_token = "fake-token"
+    fake_cfg.zenodo_base_url = "https://sandbox.zenodo.org/api"
+    fake_cfg.upload_workers = 2
+    fake_cfg.registry_journal = False
+    fake_cfg.cache_dir = tmp_path / "cache"
+
+    fake_client = MagicMock()
+    fake_client.new_version.return_value = {
+        "id": 51,
+        "links": {"bucket": "https://fake/bucket/51"},
+        "files": [
+            {"id": "f-a", "filename": "a.csv"},
+            {"id": "f-b", "filename": "b.csv"},
+            {"id": "f-old", "filename": "old.csv"},
+        ],
+    }
+    fake_client.open_deposition.side_effect = Deposition.from_json
+    fake_client.publish.return_value = {
+        "id": 51,
+        "doi": "10.5281/zenodo.51",
+        "files": [
+            {"filename": n, "checksum": "md5:" + hashlib.md5(b).hexdigest()}
+            for n, b in sorted(local.items(), reverse=True)
+        ],
+    }
+
+    with (
+        patch("cogs_archive.publish.load_config", return_value=fake_cfg),
+        patch("cogs_archive.publish.ZenodoClient", return_value=fake_client),
+    ):
+        publish_module.publish(
+            dataset_id="test_ds",
+            files=files,
+            metadata={"title": "Test dataset"},
+            version="1.1.0",
+            registry_path=registry_path,
+        )
+
+    fake_client.new_version.assert_called_once_with(50)
+    assert not fake_client.create_deposition.called
+    deleted = sorted(c.args[1] for c in fake_client.delete_file.call_args_list)
+    assert deleted == ["f-b", "f-old"]
+    pending = fake_client.upload_files.call_args.args[1]
+    assert [fp.name for fp in pending] == ["b.csv", "c.csv"]
+
+    latest = DatasetRegistry(registry_path).get("test_ds").latest()
+    assert {f["name"]: f["checksum"] for f in latest["files"]} == {
+        n: "md5:" + hashlib.md5(b).hexdigest() for n, b in local.items()
+    }
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_package_directory_round_trips_and_hashes_while_writing(
+    tmp_path, monkeypatch, compress
+):
+    import zipfile
+
+    # small blocks and a low ZIP64 threshold exercise both code paths
+    monkeypatch.setattr(publish_module, "_BLOCK", 1000)
+    monkeypatch.setattr(publish_module, "_ZIP64_LIMIT", 5000)
+    src = tmp_path / "qcew_2023"
+    (src / "data").mkdir(parents=True)
+    contents = {
+        "README.md": b"# QCEW 2023\n",
+        "data/part0.csv": b"".join(b"%d,%d\n" % (i, i * i) for i in range(2000)),
+        "data/empty.csv": b"",
+    }
+    for name, body in contents.items():
+        (src / name).write_bytes(body)
+
+    pkg = publish_module.package_directory(src, compress=compress, workers=2)
+
+    assert pkg.path == tmp_path / "qcew_2023.zip"
+    data = pkg.path.read_bytes()
+    assert pkg.size == len(data)
+    assert pkg.md5 == "md5:" + hashlib.md5(data).hexdigest()
+    assert pkg.sha256 == "sha256:" + hashlib.sha256(data).hexdigest()
+    with zipfile.ZipFile(pkg.path) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == sorted(f"qcew_2023/{n}" for n in contents)
+        for name, body in contents.items():
+            assert zf.read(f"qcew_2023/{name}") == body
+
+    # unchanged input packs to the same bytes
+    again = publish_module.package_directory(
+        src, tmp_path / "again.zip", compress=compress
+    )
+    assert again.md5 == pkg.md5
+
+
+def test_publish_packages_directories_and_checks_upload_checksum(tmp_path):
+    from cogs_archive.exceptions import ZenodoError
+    from cogs_archive.registry import DatasetRegistry
+
+    src = tmp_path / "qcew_2023"
+    src.mkdir()
+    (src / "data.csv").write_text("a,b\n1,2\n")
+
+    fake_cfg = MagicMock()
+    fake_cfg.zenodo_access_token = "fake-token"
+    fake_cfg.zenodo_base_url = "https://sandbox.zenodo.org/api"
+    fake_cfg.upload_workers = 1
+    fake_cfg.registry_journal = False
+    fake_cfg.cache_dir = tmp_path / "cache"
+
+    fake_client = MagicMock()
+    fake_client.create_deposition.return_value = {
+        "id": 7,
+        "links": {"bucket": "https://fake/bucket/7"},
+    }
+    fake_client.open_deposition.side_effect = Deposition.from_json
+    fake_client.get_deposition.return_value = {"id": 7, "submitted": False}
+    corrupt = [True]
+    uploaded = {}
+
+    def upload_files(handle, pending, workers, progress, on_done):
+        for fp in pending:
+            data = fp.read_bytes()
+            if corrupt:
+                corrupt.pop()
+                data = data[:-1]
+            uploaded[fp.name] = "md5:" + hashlib.md5(data).hexdigest()
+            on_done(fp, {"checksum": uploaded[fp.name], "size": len(data)})
+
+    def publish(dep_id):
+        files = [{"filename": n, "checksum": c} for n, c in uploaded.items()]
+        return {"id": 7, "doi": "10.5281/zenodo.7", "files": files}
+
+    fake_client.upload_files.side_effect = upload_files
+    fake_client.publish.side_effect = publish
+
+    def run():
+        return publish_module.publish(
+            dataset_id="qcew_2023",
+            files=[src],
+            metadata={"title": "QCEW 2023"},
+            version="1.0.0",
+            registry_path=tmp_path / "data-registry.yaml",
+        )
+
+    with (
+        patch("cogs_archive.publish.load_config", return_value=fake_cfg),
+        patch("cogs_archive.publish.ZenodoClient", return_value=fake_client),
+    ):
+        with pytest.raises(ZenodoError, match="Checksum mismatch"):
+            run()
+        assert not fake_client.publish.called
+        run()
+
+    pending = fake_client.upload_files.call_args.args[1]
+    assert [fp.name for fp in pending] == ["qcew_2023.zip"]
+    (entry,) = (
+        DatasetRegistry(tmp_path / "data-registry.yaml")
+        .get("qcew_2023")
+        .latest()["files"]
+    )
+    assert entry["name"] == "qcew_2023.zip"
+    assert entry["checksum"].startswith("md5:")
+    assert entry["sha256"].startswith("sha256:")
+    assert not (tmp_path / "cache" / "packages" / "qcew_2023-1.0.0").exists()
+
+
+def test_rerun_after_publish_does_not_package_again(tmp_path):
+    from cogs_archive.registry import DatasetRegistry
+
+    src = tmp_path / "qcew_2023"
+    src.mkdir()
+    (src / "data.csv").write_text("a,b\n1,2\n")
+
+    fake_cfg = MagicMock()
+    fake_cfg.zenodo_access_token = "fake-token"
+    fake_cfg.zenodo_base_url = "https://sandbox.zenodo.org/api"
+    fake_cfg.upload_workers = 1
+    fake_cfg.registry_journal = False
+    fake_cfg.cache_dir = tmp_path / "cache"
+
+    fake_client = MagicMock()
+    fake_client.create_deposition.return_value = {
+        "id": 7,
+        "links": {"bucket": "https://fake/bucket/7"},
+    }
+    fake_client.open_deposition.side_effect = Deposition.from_json
+    fake_client.publish.return_value = {
+        "id": 7,
+        "doi": "10.5281/zenodo.7",
+        "files": [{"filename": "qcew_2023.zip", "checksum": "md5:" + "0" * 32}],
+    }
+
+    def run():
+        return publish_module.publish(
+            dataset_id="qcew_2023",
+            files=[src],
+            metadata={"title": "QCEW 2023"},
+            version="1.0.0",
+            registry_path=tmp_path / "data-registry.yaml",
+        )
+
+    upsert = DatasetRegistry.upsert_version
+    crash = [True]
+
+    def flaky_upsert(self, *args, **kwargs):
+        # dies after Zenodo published, before the registry was written
+        if crash:
+            crash.pop()
+            raise OSError("disk full")
+        return upsert(self, *args, **kwargs)
+
+    with (
+        patch("cogs_archive.publish.load_config", return_value=fake_cfg),
+        patch("cogs_archive.publish.ZenodoClient", return_value=fake_client),
+        patch.object(DatasetRegistry, "upsert_version", flaky_upsert),
+        patch(
+            "cogs_archive.publish.package_directory",
+            wraps=publish_module.package_directory,
+        ) as package,
+    ):
+        with pytest.raises(OSError):
+            run()
+        assert package.call_count == 1
+        res = run()
+
+    assert res["doi"] == "10.5281/zenodo.7"
+    assert package.call_count == 1
+    assert fake_client.publish.call_count == 1
+    (entry,) = (
+        DatasetRegistry(tmp_path / "data-registry.yaml")
+        .get("qcew_2023")
+        .latest()["files"]
+    )
+    assert entry["name"] == "qcew_2023.zip"
+    assert entry["sha256"].startswith("sha256:")
+
+
+def test_rerun_of_a_draft_published_before_the_crash_does_not_package_again(
+    tmp_path,
+):
+    from cogs_archive.publish_state import PublishState
+
+    src = tmp_path / "qcew_2023"
+    src.mkdir()
+    (src / "data.csv").write_text("a,b\n1,2\n")
+
+    fake_cfg = MagicMock()
+    fake_cfg.zenodo_access_token = "fake-token"
+    fake_cfg.zenodo_base_url = "https://sandbox.zenodo.org/api"
+    fake_cfg.upload_workers = 1
+    fake_cfg.registry_journal = False
+    fake_cfg.cache_dir = tmp_path / "cache"
+
+    published = {
+        "id": 7,
+        "doi": "10.5281/zenodo.7",
+        "submitted": True,
+        "files": [{"filename": "qcew_2023.zip", "checksum": "md5:" + "0" * 32}],
+    }
+    fake_client = MagicMock()
+    fake_client.create_deposition.return_value = {
+        "id": 7,
+        "links": {"bucket": "https://fake/bucket/7"},
+    }
+    fake_client.open_deposition.side_effect = Deposition.from_json
+    fake_client.publish.return_value = published
+    fake_client.get_deposition.return_value = published
+
+    set_published = PublishState.set_published
+    crash = [True]
+
+    def flaky_set_published(self, *args, **kwargs):
+        # Zenodo published the draft, but the state never heard about it
+        if crash:
+            crash.pop()
+            raise OSError("disk full")
+        return set_published(self, *args, **kwargs)
+
+    def run():
+        return publish_module.publish(
+            dataset_id="qcew_2023",
+            files=[src],
+            metadata={"title": "QCEW 2023"},
+            version="1.0.0",
+            registry_path=tmp_path / "data-registry.yaml",
+        )
+
+    with (
+        patch("cogs_archive.publish.load_config", return_value=fake_cfg),
+        patch("cogs_archive.publish.ZenodoClient", return_value=fake_client),
+        patch.object(PublishState, "set_published", flaky_set_published),
+        patch(
+            "cogs_archive.publish.package_directory",
+            wraps=publish_module.package_directory,
+        ) as package,
+    ):
+        with pytest.raises(OSError):
+            run()
+        res = run()
+
+    assert res["doi"] == "10.5281/zenodo.7"
+    assert package.call_count == 1
+    assert fake_client.publish.call_count == 1
@@ -0,0 +1,266 @@
+# tests/test_registry_unit.py
+import hashlib
+import threading
+
+import pytest
+
+import cogs_archive.registry as registry_module
+from cogs_archive.exceptions import RegistryError, ZenodoError
+from cogs_archive.cache import Cache
+from cogs_archive.registry import DatasetRegistry
+
+
+def _version(v, doi):
+    return {
+        "zenodo": {
+            "conceptdoi": "10.5281/zenodo.1",
+            "versions": [{"version": v, "doi": doi, "files": []}],
+        }
+    }
+
+
+def test_lookups_reuse_parse_until_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "data-registry.yaml"
+    reg = DatasetRegistry(path)
+    reg.upsert_version("qcew_2024", _version("1.0.0", "10.5281/zenodo.2"))
+
+    parses = []
+    real_load = registry_module.yaml.load
+
+    def counting_load(*args, **kwargs):
+        parses.append(1)
+        return real_load(*args, **kwargs)
+
+    monkeypatch.setattr(registry_module.yaml, "load", counting_load)
+
+    for _ in range(5):
+        assert reg.list_ids() == ["qcew_2024"]
+        assert reg.get("qcew_2024").doi == "10.5281/zenodo.2"
+    assert len(parses) == 1
+
+    DatasetRegistry(path).upsert_version(
+        "qcew_2024", _version("1.1.0", "10.5281/zenodo.3")
+    )
+    assert reg.get("qcew_2024").doi == "10.5281/zenodo.3"
+
+
+def test_get_by_doi_matches_concept_and_version_dois(tmp_path):
+    reg = DatasetRegistry(tmp_path / "data-registry.yaml")
+    reg.upsert_version("qcew_2024", _version("1.0.0", "10.5281/zenodo.2"))
+
+    assert reg.get_by_doi("10.5281/zenodo.1").dataset_id == "qcew_2024"
+    assert reg.get_by_doi("10.5281/zenodo.2").dataset_id == "qcew_2024"
+    with pytest.raises(RegistryError):
+        reg.get_by_doi("10.5281/zenodo.404")
+
+
+def test_concurrent_upserts_keep_every_version(tmp_path):
+    path = tmp_path / "data-registry.yaml"
+
+    def publish_one(i):
+        # a separate registry object per writer, as in separate publish() jobs
+        DatasetRegistry(path).upsert_version(
+            "qcew_2024", _version(f"1.{i}.0", f"10.5281/zenodo.{100 + i}")
+        )
+
+    threads = [threading.Thread(target=publish_one, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    versions = DatasetRegistry(path).get("qcew_2024").spec["zenodo"]["versions"]
+    assert sorted(v["version"] for v in versions) == sorted(
+        f"1.{i}.0" for i in range(20)
+    )
+
+
+def test_transaction_writes_once_and_not_at_all_on_error(tmp_path, monkeypatch):
+    path = tmp_path / "data-registry.yaml"
+    reg = DatasetRegistry(path)
+    writes = []
+    real_write = registry_module._atomic_write
+    monkeypatch.setattr(
+        registry_module,
+        "_atomic_write",
+        lambda p, data: writes.append(p) or real_write(p, data),
+    )
+
+    reg.upsert_many(
+        [(f"ds_{i}", _version("1.0.0", f"10.5281/zenodo.{i}")) for i in range(10)]
+    )
+    assert len(writes) == 1
+    assert len(reg.list_ids()) == 10
+
+    with pytest.raises(RuntimeError):
+        with reg.transaction():
+            reg.upsert_version("ds_new", _version("1.0.0", "10.5281/zenodo.99"))
+            raise RuntimeError("abort")
+    assert len(writes) == 1
+    assert "ds_new" not in reg.list_ids()
+
+
+def test_journal_appends_without_rewriting_and_compacts(tmp_path, monkeypatch):
+    path = tmp_path / "data-registry.yaml"
+    journal = tmp_path / "data-registry.yaml.journal"
+    DatasetRegistry(path).upsert_version(
+        "qcew_2024", _version("1.0.0", "10.5281/zenodo.2")
+    )
+    writes = []
+    real_write = registry_module._atomic_write
+    monkeypatch.setattr(
+        registry_module,
+        "_atomic_write",
+        lambda p, data: writes.append(p) or real_write(p, data),
+    )
+
+    reg = DatasetRegistry(path, journal=True)
+    reg.upsert_version("qcew_2024", _version("1.1.0", "10.5281/zenodo.3"))
+    reg.upsert_many([("acs_2023", _version("1.0.0", "10.5281/zenodo.4"))])
+    assert writes == []
+    assert len(journal.read_text().splitlines()) == 2
+
+    # readers in either mode see snapshot + journal
+    plain = DatasetRegistry(path)
+    assert plain.list_ids() == ["acs_2023", "qcew_2024"]
+    assert plain.get_by_doi("10.5281/zenodo.3").dataset_id == "qcew_2024"
+
+    # a torn trailing record is skipped and does not swallow the next one
+    with journal.open("a") as f:
+        f.write('{"dataset_id": "bro')
+    reg.upsert_version("qcew_2024", _version("1.2.0", "10.5281/zenodo.5"))
+    assert reg.get("qcew_2024").doi == "10.5281/zenodo.5"
+
+    reg.compact()
+    assert len(writes) == 1
+    assert not journal.exists()
+    versions = plain.get("qcew_2024").spec["zenodo"]["versions"]
+    assert [v["version"] for v in versions] == ["1.0.0", "1.1.0", "1.2.0"]
+
+
+def test_journal_replay_skips_versions_already_compacted(tmp_path):
+    path = tmp_path / "data-registry.yaml"
+    reg = DatasetRegistry(path, journal=True, compact_after=2)
+    reg.upsert_version("qcew_2024", _version("1.0.0", "10.5281/zenodo.2"))
+    journal_text = (tmp_path / "data-registry.yaml.journal").read_text()
+    reg.upsert_version("qcew_2024", _version("1.1.0", "10.5281/zenodo.3"))
+    assert not (tmp_path / "data-registry.yaml.journal").exists()
+
+    # as if compaction crashed after the rewrite but before removing the journal
+    (tmp_path / "data-registry.yaml.journal").write_text(journal_text)
+    versions = reg.get("qcew_2024").spec["zenodo"]["versions"]
+    assert [v["version"] for v in versions] == ["1.0.0", "1.1.0"]
+
+
+class _FakeRecords:
+    def __init__(self, records):
+        self.records = records
+        self.calls = []
+
+    def get_record(self, recid):
+        self.calls.append(recid)
+        if recid not in self.records:
+            raise ZenodoError(f"Get record failed: 404 {recid}")
+        return self.records[recid]
+
+
+def test_sync_updates_changed_entries_in_one_write(tmp_path, monkeypatch):
+    path = tmp_path / "data-registry.yaml"
+    reg = DatasetRegistry(path)
+    for i, recid in enumerate([10, 11, 12]):
+        reg.upsert_version(
+            f"ds_{i}",
+            {
+                "zenodo": {
+                    "versions": [
+                        {
+                            "version": "1.0.0",
+                            "recid": recid,
+                            "files": [{"name": "a.csv", "checksum": "md5:old"}],
+                        }
+                    ]
+                }
+            },
+        )
+    client = _FakeRecords(
+        {
+            10: {"files": [{"key": "a.csv", "checksum": "md5:old"}]},
+            11: {
+                "files": [
+                    {
+                        "key": "a.csv",
+                        "checksum": "md5:new",
+                        "size": 3,
+                        "links": {"self": "https://zenodo/11/a.csv"},
+                    }
+                ]
+            },
+        }
+    )
+    writes = []
+    real_write = registry_module._atomic_write
+    monkeypatch.setattr(
+        registry_module,
+        "_atomic_write",
+        lambda p, data: writes.append(p) or real_write(p, data),
+    )
+
+    report = reg.sync(client, workers=3)
+
+    assert sorted(client.calls) == [10, 11, 12]
+    assert report.checked == 3
+    assert [recid for recid, _ in report.errors] == [12]
+    assert report.updated == [("ds_1", "1.0.0")]
+    assert len(writes) == 1
+    f = reg.get("ds_1").latest()["files"][0]
+    assert (f["checksum"], f["size"], f["download_url"]) == (
+        "md5:new",
+        3,
+        "https://zenodo/11/a.csv",
+    )
+
+    # nothing changed since: no write at all
+    assert reg.sync(client).updated == []
+    assert len(writes) == 1
+
+
+def test_prefetch_warms_cache_and_reports_failures(tmp_path, monkeypatch):
+    monkeypatch.setenv("LABARCHIVE_CACHE_DIR", str(tmp_path / "cache"))
+    bodies = {"shared": b"same in every version", "new": b"only in 1.1.0"}
+
+    def release(version, *names):
+        files = [
+            {
+                "name": f"{n}.csv",
+                "checksum": "md5:" + hashlib.md5(bodies[n]).hexdigest(),
+                "download_url": f"https://fake/{n}",
+            }
+            for n in names
+        ]
+        return {"zenodo": {"versions": [{"version": version, "files": files}]}}
+
+    reg = DatasetRegistry(tmp_path / "data-registry.yaml")
+    reg.upsert_version("ds_a", release("1.0.0", "shared"))
+    reg.upsert_version("ds_a", release("1.1.0", "shared", "new"))
+    downloads = []
+
+    def fake_download(self, url, dest, progress=None, limiter=None, checksum=None):
+        downloads.append(url)
+        dest.write_bytes(bodies[url.rsplit("/", 1)[1]])
+        self.index.record(dest, checksum)
+
+    monkeypatch.setattr(Cache, "download", fake_download)
+
+    report = reg.prefetch(["ds_a", "ds_a", "missing"], ["1.0.0", None, None], workers=4)
+
+    assert sorted(downloads) == ["https://fake/new", "https://fake/shared"]
+    assert sorted(report.fetched) == [("ds_a", "1.0.0"), ("ds_a", "1.1.0")]
+    assert [p.read_bytes() for p in report.fetched[("ds_a", "1.1.0")]] == [
+        bodies["shared"],
+        bodies["new"],
+    ]
+    assert [(ds, v) for ds, v, _ in report.errors] == [("missing", None)]
+
+    # the job array's own fetch() is now a cache hit
+    assert reg.get("ds_a").fetch() == report.fetched[("ds_a", "1.1.0")]
+    assert len(downloads) == 2
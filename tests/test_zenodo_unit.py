@@ -0,0 +1,280 @@
+# tests/test_zenodo_unit.py
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import cogs_archive.http as http_module
+from cogs_archive import metrics
+from cogs_archive.aio import AsyncZenodoClient
+from cogs_archive.http import RateLimiter
+from cogs_archive.zenodo import Deposition, ZenodoClient
+
+
+class _BucketHandler(BaseHTTPRequestHandler):
+    fail_puts = 0
+    bodies = []
+    gets = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        type(self).gets += 1
+        base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._json(200, {"id": 1, "links": {"bucket": f"{base}/bucket"}})
+
+    def do_PUT(self):
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        if type(self).fail_puts:
+            type(self).fail_puts -= 1
+            self._json(503, {"message": "try later"})
+            return
+        self.bodies.append(data)
+        key = self.path.split("?")[0].rsplit("/", 1)[1]
+        self._json(201, {"key": key, "size": len(data)})
+
+
+@pytest.fixture
+def base_url():
+    _BucketHandler.fail_puts = 0
+    _BucketHandler.bodies = []
+    _BucketHandler.gets = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _BucketHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def test_upload_file_retries_server_errors_and_reports_progress(tmp_path, base_url):
+    fp = tmp_path / "data.csv"
+    fp.write_bytes(b"a,b\n" * 10_000)
+    _BucketHandler.fail_puts = 2
+    seen = []
+    client = ZenodoClient(access_token="t", base_url=base_url, backoff_s=0)
+
+    res = client.upload_file(1, fp, progress=lambda n, done, total: seen.append(done))
+
+    assert res == {"key": "data.csv", "size": 40_000}
+    assert _BucketHandler.bodies == [fp.read_bytes()]
+    assert seen[-1] == 40_000
+
+
+def test_upload_files_reuses_bucket_link_from_handle(tmp_path, base_url):
+    files = []
+    for i in range(5):
+        fp = tmp_path / f"part{i}.csv"
+        fp.write_text(f"row {i}\n")
+        files.append(fp)
+    handle = Deposition.from_json({"id": 1, "links": {"bucket": f"{base_url}/bucket"}})
+    client = ZenodoClient(access_token="t", base_url=base_url)
+
+    res = client.upload_files(handle, files, workers=3)
+
+    assert [r["key"] for r in res] == [fp.name for fp in files]
+    assert _BucketHandler.gets == 0
+    client.upload_files(1, files[:2])
+    assert _BucketHandler.gets == 1
+
+
+def test_client_sends_every_call_through_one_pooled_session(base_url, monkeypatch):
+    client = ZenodoClient(access_token="t", base_url=base_url, pool_size=7)
+    adapter = client.session.get_adapter(base_url)
+    assert adapter.poolmanager.connection_pool_kw["maxsize"] == 7
+    retry = adapter.max_retries
+    assert retry.total == client.max_retries
+    assert set(retry.status_forcelist) == {500, 502, 503, 504}
+    assert retry.allowed_methods == {"GET", "HEAD"}
+
+    created = []
+    monkeypatch.setattr(requests, "Session", lambda: created.append(1))
+    sent = []
+    request = client.session.request
+    monkeypatch.setattr(
+        client.session,
+        "request",
+        lambda *a, **kw: sent.append(a[0]) or request(*a, **kw),
+    )
+    for _ in range(3):
+        client.get_deposition(1)
+
+    assert sent == ["GET"] * 3
+    assert created == []
+
+
+class _RecordHandler(BaseHTTPRequestHandler):
+    statuses = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.statuses.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.statuses.append(200)
+        body = json.dumps({"id": 7, "files": []}).encode()
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_get_record_revalidates_cached_response_with_etag(tmp_path):
+    _RecordHandler.statuses = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _RecordHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    try:
+        for _ in range(2):
+            client = ZenodoClient(
+                access_token="t", base_url=base_url, record_cache_dir=tmp_path
+            )
+            assert client.get_record(7) == {"id": 7, "files": []}
+    finally:
+        httpd.shutdown()
+    assert _RecordHandler.statuses == [200, 304]
+
+
+class _ThrottlingHandler(BaseHTTPRequestHandler):
+    throttle_first = 0
+    hits = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        type(self).hits += 1
+        if type(self).throttle_first:
+            type(self).throttle_first -= 1
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps({"id": 7}).encode()
+        self.send_response(200)
+        self.send_header("X-RateLimit-Remaining", "99")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_throttled_requests_are_retried_transparently():
+    _ThrottlingHandler.throttle_first = 2
+    _ThrottlingHandler.hits = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _ThrottlingHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        client = ZenodoClient(
+            access_token="t", base_url=f"http://127.0.0.1:{httpd.server_address[1]}"
+        )
+        assert client.get_record(7) == {"id": 7}
+    finally:
+        httpd.shutdown()
+    assert _ThrottlingHandler.hits == 3
+
+
+def test_requests_and_retries_are_counted_per_endpoint():
+    _ThrottlingHandler.throttle_first = 1
+    _ThrottlingHandler.hits = 0
+    counts = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _ThrottlingHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        client = ZenodoClient(
+            access_token="t", base_url=f"http://127.0.0.1:{httpd.server_address[1]}"
+        )
+        hook = metrics.CallbackInstrumentation(
+            on_count=lambda name, value, attrs: counts.append((name, attrs))
+        )
+        with metrics.instrumented(hook):
+            client.get_record(7)
+    finally:
+        httpd.shutdown()
+    endpoint = "/records/{id}"
+    assert counts == [
+        ("zenodo.requests", {"method": "GET", "endpoint": endpoint, "status": 429}),
+        ("zenodo.retries", {"endpoint": endpoint}),
+        ("zenodo.requests", {"method": "GET", "endpoint": endpoint, "status": 200}),
+    ]
+
+
+def test_rate_limiter_paces_callers_and_honours_exhausted_window(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(http_module.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(http_module.time, "time", lambda: 1000 + clock[0])
+    sleeps = []
+
+    def fake_sleep(s):
+        sleeps.append(s)
+        clock[0] += s
+
+    monkeypatch.setattr(http_module.time, "sleep", fake_sleep)
+    limiter = RateLimiter(per_minute=60, burst=2)
+
+    for _ in range(4):
+        limiter.acquire()
+    # two from the burst, then one per second
+    assert sleeps == [pytest.approx(1.0), pytest.approx(1.0)]
+
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["X-RateLimit-Remaining"] = "0"
+    response.headers["X-RateLimit-Reset"] = str(int(1000 + clock[0]) + 30)
+    assert limiter.observe(response) == pytest.approx(30, abs=1)
+    sleeps.clear()
+    limiter.acquire()
+    assert sum(sleeps) == pytest.approx(30, abs=1)
+
+
+def test_clients_of_one_token_share_the_first_budget():
+    first = ZenodoClient(access_token="shared", requests_per_min=30)
+    assert ZenodoClient(access_token="shared", requests_per_min=30).rate_limiter is (
+        first.rate_limiter
+    )
+
+    with pytest.warns(RuntimeWarning, match="requests_per_min=60 ignored"):
+        second = ZenodoClient(access_token="shared", requests_per_min=60)
+
+    assert second.rate_limiter is first.rate_limiter
+    assert first.rate_limiter.rate == pytest.approx(0.5)
+
+
+def test_async_client_uploads_concurrently(tmp_path, base_url):
+    files = []
+    for i in range(4):
+        fp = tmp_path / f"part{i}.csv"
+        fp.write_text(f"row {i}\n")
+        files.append(fp)
+    done = []
+
+    async def main():
+        client = AsyncZenodoClient(
+            access_token="t", base_url=base_url, max_concurrency=2
+        )
+        return await client.upload_files(
+            1,
+            files,
+            on_done=lambda fp, res: done.append((fp.name, threading.get_ident())),
+        )
+
+    res = asyncio.run(main())
+
+    assert [r["key"] for r in res] == [fp.name for fp in files]
+    assert sorted(done) == [(fp.name, threading.get_ident()) for fp in files]
+    assert _BucketHandler.gets == 1